@@ -15,6 +15,10 @@ from matplotlib.colors import LogNorm
 
 from scipy.spatial import ConvexHull
 
+# recorder.py is a shared module of Experiments/, imported like the scripts there import common_problem;
+# run from this folder with Experiments/ on the path: PYTHONPATH=../.. python toy_adv.py
+from recorder import TrajectoryRecorder
+
 ################################################################################
 #
 #  Bilevel Optimization Toy Example
@@ -36,16 +40,15 @@ from scipy.spatial import ConvexHull
 UPPER=10
 LOWER=-10
 
-def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
-    xs, ws, fs, gs, xhats = [], [], [], [], []
+def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
 
     xhat = copy.deepcopy(x)
     x_opt = torch.optim.SGD([x], lr=x_lr)
     w_opt = torch.optim.SGD([w], lr=w_lr)
     xhat_opt = torch.optim.SGD([xhat], lr=xhat_lr)
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     n_params_x = x.numel()
     n_params_w = w.numel()
@@ -61,8 +64,6 @@ def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
             xhat_opt.step()
             xhat.data.clamp_(LOWER, UPPER)
 
-        xhats.append(xhat.data.clone().view(-1).cpu())
-
         g_gap = (g(x, w) - g(xhat, w)).data.clone()
         
         # prepare gradients 
@@ -89,65 +90,50 @@ def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
         x.data.clamp_(LOWER, UPPER)
         w.data.clamp_(LOWER, UPPER)
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), xhat=xhat.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'xhat': torch.vstack(xhats),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
+    return rec.result()
 
 
-def optimistic(x, w, x_lr, w_lr, xhat_lr, k, maxIter):
-    xs, ws, fs, gs = [], [], [], []
+def optimistic(x, w, x_lr, w_lr, xhat_lr, k, maxIter, record_fields=None):
+    # records on its own schedule (the first iteration, then every k-th), and the previous
+    # iterate of the optimistic step is the last recorded one
+    rec = TrajectoryRecorder(maxIter, k, record_fields)
 
     x_opt = torch.optim.SGD([x], lr=x_lr)
     w_opt = torch.optim.SGD([w], lr=w_lr)
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+    x_last, w_last = x.data.clone().view(-1), w.data.clone().view(-1)
+    rec.record(x=x_last, w=w_last)
 
     from copy import deepcopy
 
     for i in range(maxIter):
 
         if i == 0:
-            x_prev = torch.Tensor(xs[-1]*2).requires_grad_()
-            w_prev = torch.Tensor(ws[-1]*2).requires_grad_()
+            x_prev = torch.Tensor(x_last*2).requires_grad_()
+            w_prev = torch.Tensor(w_last*2).requires_grad_()
         else:
-            x_prev = torch.Tensor(xs[-1]).requires_grad_()
-            w_prev = torch.Tensor(ws[-1]).requires_grad_()
+            x_prev = torch.Tensor(x_last).requires_grad_()
+            w_prev = torch.Tensor(w_last).requires_grad_()
 
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if ((i+1) % k == 0 or i == 0) and rec.wants('g') else None
 
         w.data = (w.data - 2 * w_lr * x.data + w_lr * x_prev.data).clone()
         x.data = (x.data + 2 * x_lr * w.data - x_lr * w_prev.data).clone()
 
         if (i+1) % k == 0 or i == 0:
-            xs.append(x.data.clone().view(-1).cpu())
-            ws.append(w.data.clone().view(-1).cpu())
-            fs.append(f(x,w).data.clone().view(-1).cpu())
-            gs.append(g_gap.clone().view(-1).cpu())
+            x_last, w_last = x.data.clone().view(-1).cpu(), w.data.clone().view(-1).cpu()
+            rec.record(x=x_last, w=w_last, f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
+    return rec.result()
 
 
-def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
-    xs, ws, fs, gs = [], [], [], []
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     w_opt = torch.optim.SGD([w], lr=w_lr)
     x_opt = torch.optim.SGD([x], lr=x_lr)
@@ -173,18 +159,10 @@ def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
         w_opt.step()
         w.data.clamp_(LOWER, UPPER)
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
+    return rec.result()
 
 
 def calculate_g_gap(x, w, lr, k):
@@ -196,11 +174,9 @@ def calculate_g_gap(x, w, lr, k):
     return g0 - gnow
 
 
-def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
-    xs, ws, fs, gs, gns = [], [], [], [], []
-
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     z_l2_reg_coef = l2_reg
     y_l2_reg_coef = l2_reg
@@ -222,7 +198,8 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
             z_opt.step()
             z.data.clamp_(LOWER, UPPER)
 
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if rec.due(i) and rec.wants('g') else None
 
         for it in range(k):
             x_opt.zero_grad()
@@ -243,24 +220,15 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
         w_opt.step()
         w.data.clamp_(LOWER, UPPER)
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
+    return rec.result()
 
 
-def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamma=0.1):
-    xs, ws, fs, gs, gns = [], [], [], [], []
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamma=0.1, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     def penalty_gx(x, w, gamma_k, nu_k):
         gx = torch.autograd.grad(g(x,w), x, create_graph=True, allow_unused=True)[0]
@@ -289,7 +257,8 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamm
 
     for i in range(maxIter):
 
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if rec.due(i) and rec.wants('g') else None
         for j in range(k):
             x_opt.zero_grad()
             grad, gx_norm = penalty_gx(x, w, gamma, nu)
@@ -314,20 +283,14 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamm
             x_opt = torch.optim.SGD([x], lr=x_lr)
             print("update gamma and eps", gamma, eps)
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
-        gns.append((f_x(x,w).data.norm().cpu(), f_w(x,w).data.norm().cpu(), g_x(x,w).data.norm().cpu(), g_w(x,w).data.norm().cpu()))
-
-    fx_, fw_, gx_, gw_ = map(torch.vstack, zip(*gns))
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-        'gns' : (fx_.view(-1), fw_.view(-1), gx_.view(-1), gw_.view(-1)),
-    }
+        if rec.due(i):
+            # the four gradient norms cost four autograd passes, so they are only computed when recorded
+            gns = torch.stack((f_x(x,w).data.norm(), f_w(x,w).data.norm(), g_x(x,w).data.norm(), g_w(x,w).data.norm())) if rec.wants('gns') else None
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap, gns=gns)
+
+    res = rec.result()
+    if 'gns' in res:
+        res['gns'] = tuple(res['gns'].T)
     return res
 
 
@@ -11,6 +11,13 @@ import matplotlib.pyplot as plt
 
 from scipy.spatial import ConvexHull
 
+# recorder.py, common_problem.py and bome_batched.py are shared modules of Experiments/, imported like the scripts
+# there import common_problem; run from this folder with Experiments/ on the path: PYTHONPATH=../.. python toy_convergence.py
+from recorder import TrajectoryRecorder
+from common_problem import oracle
+import bome_batched
+from bome_batched import split_batched
+
 ################################################################################
 #
 #  Bilevel Optimization Toy Example
@@ -30,16 +37,15 @@ from scipy.spatial import ConvexHull
 ################################################################################
 
 
-def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
-    xs, ws, fs, gs, xhats = [], [], [], [], []
+def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
 
     xhat = copy.deepcopy(x)
     x_opt = torch.optim.SGD([x], lr=x_lr)
     w_opt = torch.optim.SGD([w], lr=w_lr)
     xhat_opt = torch.optim.SGD([xhat], lr=xhat_lr)
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     n_params_x = x.numel()
     n_params_w = w.numel()
@@ -53,7 +59,6 @@ def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
             xhat.grad = g_x(xhat, w).data.clone()
             xhat_opt.step()
 
-        xhats.append(xhat.data.clone().view(-1).cpu())
         g_gap = (g(x, w) - g(xhat, w)).data.clone()
         
         # prepare gradients 
@@ -87,26 +92,24 @@ def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
         w_opt.step()
         x_opt.step()
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), xhat=xhat.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
+
+    return rec.result()
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'xhat': torch.vstack(xhats),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
 
+def bilevel_descent_bome_batched(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, record_stride=1, record_fields=None):
+    # the shared batched bome (Experiments/bome_batched.py) on this f and g, with bilevel_descent_bome's
+    # 1e-4 damping, no clamping and its record keys
+    if record_fields is None:
+        record_fields = ('x', 'xhat', 'w', 'f', 'g')
+    return bome_batched.bilevel_descent_bome_batched(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, oracle(f), oracle(g),
+                                                     record_stride, record_fields, damping=1e-4)
 
-def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
-    xs, ws, fs, gs = [], [], [], []
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
     w_opt = torch.optim.SGD([w], lr=w_lr)
     x_opt = torch.optim.SGD([x], lr=x_lr)
 
@@ -129,18 +132,10 @@ def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
         w.grad = (fw - fx.view(-1).dot(gx.view(-1)) / (gx.view(-1).dot(gx.view(-1))+1e-50) * gw).data
         w_opt.step()
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
+    return rec.result()
 
 
 def calculate_g_gap(x, w, lr, k):
@@ -152,11 +147,9 @@ def calculate_g_gap(x, w, lr, k):
     return g0 - gnow
     
 
-def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
-    xs, ws, fs, gs = [], [], [], []
-
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     z_l2_reg_coef = l2_reg
     y_l2_reg_coef = l2_reg
@@ -177,7 +170,8 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
             loss_z.backward()
             z_opt.step()
 
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if rec.due(i) and rec.wants('g') else None
 
         for it in range(k):
             x_opt.zero_grad()
@@ -196,25 +190,15 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
         loss_w.backward()
         w_opt.step()
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res 
+    return rec.result()
 
 
-def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.01, eps=0.01, gamma=0.01):
-    xs, ws, fs, gs = [], [], [], []
-
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.01, eps=0.01, gamma=0.01, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     def penalty_gx(x, w, gamma_k, nu_k):
         gx = torch.autograd.grad(g(x,w), x, create_graph=True, allow_unused=True)[0]
@@ -241,7 +225,8 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.01, eps=0.01, ga
 
     for i in range(maxIter):
 
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if rec.due(i) and rec.wants('g') else None
         for j in range(k):
             x_opt.zero_grad()
             grad, gx_norm = penalty_gx(x, w, gamma, nu)
@@ -264,18 +249,10 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.01, eps=0.01, ga
             x_opt = torch.optim.SGD([x], lr=x_lr)
             print("update gamma and eps", gamma, eps)
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap)
 
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-    }
-    return res
+    return rec.result()
 
 
 def plotme(res, xcts0, xcts, name): 
@@ -411,12 +388,14 @@ results = {
 }
 
 
-for x_data in [torch.Tensor([0,3]), torch.Tensor([-3, 1]), torch.Tensor([3.5, -1])]:
+# bome runs from all start points as one batch
+starts = [torch.Tensor([0,3]), torch.Tensor([-3, 1]), torch.Tensor([3.5, -1])]
+bome_results = split_batched(bilevel_descent_bome_batched(torch.stack(starts), w_data.expand(len(starts), -1),
+                                                          x_lr, w_lr, xhat_lr, k, maxIter, 0.5))
+
+for x_data, res in zip(starts, bome_results):
     method = "bome"
     eta = 0.5
-    x.data = x_data.clone()
-    w.data = w_data.clone()
-    res = fn_maps[method](x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta)
     #plotme(res, xcts0, xcts, f"({x_data[0]},{x_data[1]})_{method}_k{k}_eta{eta}_iter{k}")
     results['method'][(x_data[0].item(), x_data[1].item(), method)] = res
     #print(x)
@@ -452,10 +431,11 @@ for x_data in [torch.Tensor([0,3]), torch.Tensor([-3, 1]), torch.Tensor([3.5, -1
 x_data = torch.Tensor([0,3])
 method = "bome"
 eta = 0.5
-for k, maxIter, xhat_lr in zip([1, 10, 100], [5000, 5000, 5000], [0.1, 0.05, 0.05]):
-    x.data = x_data.clone()
-    w.data = w_data.clone()
-    res = fn_maps[method](x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta)
+ks, xhat_lrs = [1, 10, 100], [0.1, 0.05, 0.05]
+maxIter = 5000
+res = bilevel_descent_bome_batched(x_data.expand(len(ks), -1), w_data.expand(len(ks), -1),
+                                   x_lr, w_lr, xhat_lrs, ks, maxIter, eta)
+for k, res in zip(ks, split_batched(res)):
     #plotme(res, xcts0, xcts, f"{method}_k{k}")
     results['iter'][k] = res
     print('finish', k)
@@ -463,10 +443,10 @@ for k, maxIter, xhat_lr in zip([1, 10, 100], [5000, 5000, 5000], [0.1, 0.05, 0.0
 maxIter = 5000
 xhat_lr = 0.05
 k = 10
-for eta in [0.1, 0.5, 0.9]:
-    x.data = x_data.clone()
-    w.data = w_data.clone()
-    res = fn_maps[method](x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta)
+etas = [0.1, 0.5, 0.9]
+res = bilevel_descent_bome_batched(x_data.expand(len(etas), -1), w_data.expand(len(etas), -1),
+                                   x_lr, w_lr, xhat_lr, k, maxIter, etas)
+for eta, res in zip(etas, split_batched(res)):
     #plotme(res, xcts0, xcts, f"{method}_eta{eta}")
     results['eta'][eta] = res
     print("finish", eta)
@@ -0,0 +1,93 @@
+import time
+import torch
+import torch.nn.functional as F
+
+from recorder import TrajectoryRecorder
+
+
+# bome on a batch of independent trajectories, shared by toy_lls.py and BOME/toy/toy_convergence.py
+
+
+def per_trajectory(value, N, like, dtype=None):
+    # scalar or length-N setting as an (N, 1, ..., 1) tensor that broadcasts against the batch tensor like
+    value = torch.as_tensor(value, dtype=dtype or like.dtype, device=like.device).reshape(-1).expand(N)
+    return value.reshape((N,) + (1,) * (like.dim() - 1))
+
+
+def bilevel_descent_bome_batched(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, f_oracle, g_oracle,
+                                 record_stride=1, record_fields=None, damping=1e-8, bounds=None):
+    # N independent bome trajectories advanced in lockstep: row i of x (N, ...) and w (N, ...) is the start
+    # of trajectory i, and x_lr, w_lr, xhat_lr, k and eta are scalars or one value per trajectory.
+    # f_oracle and g_oracle are the fused per-sample oracles of f and g (see common_problem.oracle); they are
+    # vectorized with torch.func.vmap, so a whole sweep costs one run.
+    # damping is added to ||dg||^2 in the bome weight, and x and xhat are clamped to bounds = (lower, upper) if given.
+    # All trajectories take max(k) inner steps; the xhat of a trajectory with a smaller k is frozen after its k steps.
+    # res has the keys of bilevel_descent_bome with a trajectory axis after the iteration axis (see split_batched).
+    x = x.detach().clone()
+    w = w.detach().clone()
+    N = x.shape[0]
+    n_params_x = x[0].numel()
+
+    x_lr, xhat_lr, w_lr = per_trajectory(x_lr, N, x), per_trajectory(xhat_lr, N, x), per_trajectory(w_lr, N, w)
+    eta = torch.as_tensor(eta, dtype=x.dtype, device=x.device).reshape(-1).expand(N)
+    k = per_trajectory(k, N, x, dtype=torch.long)
+    k_max = int(k.max())
+
+    f_batch = torch.func.vmap(f_oracle)
+    g_batch = torch.func.vmap(g_oracle)
+    clamp = (lambda z: z) if bounds is None else (lambda z: z.clamp(*bounds))
+
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields, scalars=('t',), device=x.device)
+    rec.record(x=x, w=w)
+
+    t = 0
+
+    for i in range(maxIter):
+        t0 = time.time()
+        xhat = x
+        for j in range(k_max):
+            xhat_next = clamp(xhat - xhat_lr * g_batch(xhat, w)[1])
+            xhat = torch.where(j < k, xhat_next, xhat)
+
+        # prepare gradients, one row per trajectory
+        _, fx, fw = f_batch(x, w)
+        g_x_w, gx, gw = g_batch(x, w)
+        g_xhat_w, _, gw_xhat = g_batch(xhat, w)
+        gw_minus_gw_k = gw - gw_xhat
+        g_gap = g_x_w - g_xhat_w
+
+        df = torch.cat((fx.reshape(N, -1), fw.reshape(N, -1)), 1)
+        dg = torch.cat((gx.reshape(N, -1), gw_minus_gw_k.reshape(N, -1)), 1)
+
+        norm_dq = dg.pow(2).sum(1)
+        dot = (df * dg).sum(1)
+
+        d = df + F.relu(eta - dot/(norm_dq+damping)).view(N, 1) * dg
+
+        x_new = clamp(x - x_lr * d[:, :n_params_x].view(x.shape))
+        w = w - w_lr * d[:, n_params_x:].view(w.shape)
+        x = x_new
+        t1 = time.time()
+        t += t1-t0
+
+        if rec.due(i):
+            rec.record(x=x, xhat=xhat, w=w, f=f_batch(x, w)[0], g=g_gap, t=t, gg=g_x_w)
+
+    return {key: value.cpu() for key, value in rec.result().items()}
+
+
+def split_batched(res):
+    # one res dict per trajectory of bilevel_descent_bome_batched, laid out like bilevel_descent_bome's
+    # ('x', 'xhat', 'w' flattened per iteration, 'f', 'g', 'gg' per iteration; 't' is shared by the batch)
+    results = []
+    for i in range(res['x'].shape[1]):
+        r = {}
+        for key, value in res.items():
+            if key == 't':
+                r[key] = value
+            elif key in ['x', 'xhat', 'w']:
+                r[key] = value[:, i].reshape(value.shape[0], -1)
+            else:
+                r[key] = value[:, i]
+        results.append(r)
+    return results
@@ -1,3 +1,5 @@
+import numpy as np
+import scipy.sparse as sp
 import torch
 
 # ----- problem definition (same for all methods) -----------------
@@ -49,23 +51,186 @@ def x_star_alpha(w, alpha):
 
 
 def g_x(x, w):
-    grad = torch.autograd.grad(g(x,w), x, allow_unused=True)[0]
-    return grad if grad is not None else torch.zeros_like(x)
+    return g_oracle(x, w)[1]
 
 def g_w(x, w):
-    grad = torch.autograd.grad(g(x,w), w, allow_unused=True)[0]
-    return grad if grad is not None else torch.zeros_like(w)
+    return g_oracle(x, w)[2]
 
 def f_x(x, w):
-    grad = torch.autograd.grad(f(x,w), x, allow_unused=True)[0]
-    return grad if grad is not None else torch.zeros_like(x)
+    return f_oracle(x, w)[1]
 
 def f_w(x, w):
-    grad = torch.autograd.grad(f(x,w), w, allow_unused=True)[0]
-    return grad if grad is not None else torch.zeros_like(w)
+    return f_oracle(x, w)[2]
 
 def g_x_xhat_w(x, xhat, w):
-    loss = g(x, w) - g(xhat.detach(), w)
-    grad = torch.autograd.grad(loss, [x, w], allow_unused=True)
-    return loss.detach().cpu().item(), grad[0], grad[1]
-
+    g_x_w, grad_x, grad_w = g_oracle(x, w)
+    g_xhat_w, _, grad_w_xhat = g_oracle(xhat, w)
+    return (g_x_w - g_xhat_w).cpu().item(), grad_x, grad_w - grad_w_xhat
+
+# ----- analytic backend for the quadratic problem ------------------------
+#   f(x, w) = ||w - (3, -2)||^2 + 0.2 ||x||^2
+#   g(x, w) = 0.5 ||x - A w||^2
+
+def f_analytic(x, w):
+    # value, grad_x f = 0.4 x, grad_w f = 2 (w - (3, -2))
+    r = w - torch.tensor([3.0, -2.0], dtype=w.dtype, device=w.device)
+    return r @ r + 0.2 * (x @ x), 0.4 * x, 2.0 * r
+
+def g_analytic(x, w):
+    # value, grad_x g = x - A w, grad_w g = -A^T (x - A w)
+    r = x - A @ w
+    return 0.5 * (r @ r), r, -(A.T @ r)
+
+def f_hessians(x, w):
+    # (f_xx, f_xw, f_ww) = (0.4 I, 0, 2 I)
+    return (0.4 * torch.eye(x.numel(), dtype=x.dtype, device=x.device),
+            torch.zeros(x.numel(), w.numel(), dtype=x.dtype, device=x.device),
+            2.0 * torch.eye(w.numel(), dtype=w.dtype, device=w.device))
+
+def g_hessians(x, w):
+    # (g_xx, g_xw, g_ww) = (I, -A, A^T A)
+    return torch.eye(x.numel(), dtype=x.dtype, device=x.device), -A, A.T @ A
+
+# functions with a closed-form backend: fn -> (value_and_grads, hessians);
+# oracle and hessians dispatch to it, everything else goes through autograd
+analytic_backend = {
+    f: (f_analytic, f_hessians),
+    g: (g_analytic, g_hessians),
+}
+
+# ----- fused oracles: value and both partial gradients in one pass ----------
+
+def oracle(fn, analytic=None):
+    # returns value_and_grads(x, w) -> (value, d fn/dx, d fn/dw), detached.
+    # Without analytic, the closed form registered in analytic_backend if there is one,
+    # otherwise one forward/backward of fn through torch.func.grad_and_value
+    # (unused inputs get zero gradients); a hand-written analytic(x, w) with the same
+    # return signature replaces autograd altogether.
+    # Both are pure functions of x and w, so they can be vmapped over a batch of trajectories.
+    if analytic is None and fn in analytic_backend:
+        analytic = analytic_backend[fn][0]
+    fused = torch.func.grad_and_value(fn, argnums=(0, 1)) if analytic is None else None
+
+    def value_and_grads(x, w):
+        x, w = x.detach(), w.detach()
+        if fused is None:
+            return analytic(x, w)
+        (grad_x, grad_w), value = fused(x, w)
+        return value, grad_x, grad_w
+    return value_and_grads
+
+def hessians(fn):
+    # returns second_derivatives(x, w) -> (d2 fn/dx2, d2 fn/dxdw, d2 fn/dw2) for vector x and w,
+    # closed form when fn is in analytic_backend, torch.func.hessian otherwise
+    if fn in analytic_backend:
+        return analytic_backend[fn][1]
+    full = torch.func.hessian(fn, argnums=(0, 1))
+
+    def second_derivatives(x, w):
+        ((h_xx, h_xw), (_, h_ww)) = full(x.detach(), w.detach())
+        return h_xx, h_xw, h_ww
+    return second_derivatives
+
+f_oracle = oracle(f)
+g_oracle = oracle(g)
+
+# ----- random instances of the same family in any dimension ----------------
+#   f(x, w) = ||w - w_target||^2 + 0.2 ||x||^2
+#   g(x, w) = 0.5 ||x - A w||^2,  x, w in R^n
+# A = diag(s) Q, with Q a product of `layers` layers of random Givens rotations on
+# disjoint coordinate pairs: the singular values of A are exactly s (log-spaced from
+# 1 down to 1/cond, so cond(A) = cond) and every row and column of A has at most
+# 2**layers nonzeros, which sets the sparsity.
+
+def ell_matvec(cols, vals, v):
+    # A @ v for A stored row-wise as (n, K) column indices and values (zero padded), on the device of v
+    cols, vals = cols.to(v.device), vals.to(v.device)
+    return (vals * v[..., cols]).sum(-1)
+
+def ell_rmatvec(cols, vals, r):
+    # A^T @ r for the same storage, as a scatter-add over the columns
+    cols, vals = cols.to(r.device), vals.to(r.device)
+    return torch.zeros_like(r).index_add(0, cols.reshape(-1), (vals * r[:, None]).reshape(-1))
+
+def sparse_csr(M, dtype):
+    # scipy sparse matrix as a torch sparse CSR tensor
+    M = sp.csr_matrix(M)
+    return torch.sparse_csr_tensor(torch.from_numpy(M.indptr).long(), torch.from_numpy(M.indices).long(),
+                                   torch.tensor(M.data, dtype=dtype), size=M.shape)
+
+def random_problem(n, cond=10.0, layers=2, seed=0, dtype=torch.float32):
+    # Returns a dict with f, g, x_star_alpha and A (sparse CSR) like the module-level ones,
+    # their fused oracles and Hessian blocks (closed forms, bound to this instance instead of
+    # registered in analytic_backend; the Hessian blocks are sparse CSR), the singular values s,
+    # w_target, a start w0, L = 2 + 0.4 max(s)^2 (the Lipschitz constant of the reduced objective)
+    # and the optimal value of min_w f(x_star_alpha(w, 0), w). Products with A only gather and
+    # scatter-add, so all functions work with autograd, torch.func and vmap at any n.
+    rng = np.random.RandomState(seed)
+    Q = sp.identity(n, format="csr")
+    for _ in range(layers):
+        p = rng.permutation(n)
+        i, j = p[0:n-1:2], p[1:n:2]
+        theta = rng.uniform(0, 2*np.pi, len(i))
+        diag = np.ones(n)
+        diag[i] = diag[j] = np.cos(theta)
+        G = sp.csr_matrix((np.concatenate((diag, -np.sin(theta), np.sin(theta))),
+                           (np.concatenate((np.arange(n), i, j)), np.concatenate((np.arange(n), j, i)))), shape=(n, n))
+        Q = (G @ Q).tocsr()
+    s = np.geomspace(1.0, 1.0/cond, n)
+    rng.shuffle(s)
+    A_sp = (sp.diags(s) @ Q).tocsr()
+    w_target = rng.randn(n)
+    w0 = rng.randn(n)
+
+    # padded row-wise (ELL) copy of A for the matrix-vector products
+    counts = np.diff(A_sp.indptr)
+    rows = np.repeat(np.arange(n), counts)
+    slots = np.arange(A_sp.nnz) - np.repeat(A_sp.indptr[:-1], counts)
+    cols_np, vals_np = np.zeros((n, counts.max()), dtype=np.int64), np.zeros((n, counts.max()))
+    cols_np[rows, slots], vals_np[rows, slots] = A_sp.indices, A_sp.data
+    cols, vals = torch.from_numpy(cols_np), torch.tensor(vals_np, dtype=dtype)
+    A_n = sparse_csr(A_sp, dtype)
+    w_target_t = torch.tensor(w_target, dtype=dtype)
+
+    # Hessian blocks of f and g (constant, as both are quadratic)
+    eye = sparse_csr(sp.identity(n), dtype)
+    f_blocks = (sparse_csr(0.4 * sp.identity(n), dtype), sparse_csr(sp.csr_matrix((n, n)), dtype),
+                sparse_csr(2.0 * sp.identity(n), dtype))
+    g_blocks = (eye, sparse_csr(-A_sp, dtype), sparse_csr(A_sp.T @ A_sp, dtype))
+
+    def f_n(x, w):
+        r = w - w_target_t.to(w.device)
+        return r @ r + 0.2 * (x @ x)
+
+    def g_n(x, w):
+        r = x - ell_matvec(cols, vals, w)
+        return 0.5 * (r @ r)
+
+    def x_star_alpha_n(w, alpha):
+        return ell_matvec(cols, vals, w) / (1.0 + 0.4 * alpha)
+
+    def f_analytic_n(x, w):
+        r = w - w_target_t.to(w.device)
+        return r @ r + 0.2 * (x @ x), 0.4 * x, 2.0 * r
+
+    def g_analytic_n(x, w):
+        r = x - ell_matvec(cols, vals, w)
+        return 0.5 * (r @ r), r, -ell_rmatvec(cols, vals, r)
+
+    def f_hessians_n(x, w):
+        # (f_xx, f_xw, f_ww) = (0.4 I, 0, 2 I)
+        return tuple(block.to(x.device) for block in f_blocks)
+
+    def g_hessians_n(x, w):
+        # (g_xx, g_xw, g_ww) = (I, -A, A^T A)
+        return tuple(block.to(x.device) for block in g_blocks)
+
+    # min_w ||w - w_target||^2 + 0.2 ||A w||^2 decouples in z = Q w_target = A w_target / s
+    z = (A_sp @ w_target) / s
+    optimal_value = float(np.sum(z**2 * 0.2 * s**2 / (1.0 + 0.2 * s**2)))
+
+    return {"n": n, "A": A_n, "s": torch.tensor(s, dtype=dtype), "w_target": w_target_t,
+            "w0": torch.tensor(w0, dtype=dtype), "f": f_n, "g": g_n, "x_star_alpha": x_star_alpha_n,
+            "f_oracle": oracle(f_n, f_analytic_n), "g_oracle": oracle(g_n, g_analytic_n),
+            "f_hessians": f_hessians_n, "g_hessians": g_hessians_n,
+            "L": 2 + 0.4 * float(s.max())**2, "optimal_value": optimal_value}
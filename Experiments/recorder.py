@@ -0,0 +1,62 @@
+import torch
+
+
+class TrajectoryRecorder:
+    """
+    Preallocated trajectory storage for the toy solvers (toy_lls.py, toy_adv.py,
+    toy_convergence.py), in place of per-iteration list appends and a final vstack.
+
+    Every field gets a buffer of maxIter // stride + 1 rows (the starting point
+    plus every stride-th iteration) on its first record, on the given device, with
+    the dtype and shape of that first value; later values are copied into the next
+    row. A buffer that runs out of rows (a solver with its own record schedule)
+    doubles in size. Fields named in scalars hold one number per row, everything
+    else keeps the shape it is recorded with (x.view(-1) for the usual flattened
+    iterates). With fields set, only those names are stored.
+
+    result() gives the res dict of the solvers: one tensor per recorded field,
+    trimmed to the rows written, so existing plotting code keeps working.
+    """
+
+    def __init__(self, maxIter, stride=1, fields=None, scalars=('f', 'g', 'gg', 't'), device='cpu'):
+        self.rows = maxIter // stride + 1
+        self.stride = stride
+        self.fields = fields
+        self.scalars = scalars
+        self.device = device
+        self.buffers = {}
+        self.counts = {}
+
+    def wants(self, name):
+        # whether name is recorded, so a solver can skip computing values nobody stores
+        return self.fields is None or name in self.fields
+
+    def due(self, i):
+        # whether iteration i (0-based) falls on the record stride
+        return (i + 1) % self.stride == 0
+
+    def record(self, **values):
+        for name, value in values.items():
+            if not self.wants(name):
+                continue
+            if torch.is_tensor(value):
+                value = value.detach()
+                if name in self.scalars:
+                    value = value.reshape(())
+            if name not in self.buffers:
+                value_ = torch.as_tensor(value)
+                self.buffers[name] = torch.empty((self.rows,) + tuple(value_.shape),
+                                                 dtype=value_.dtype if torch.is_tensor(value) else torch.get_default_dtype(),
+                                                 device=self.device)
+                self.counts[name] = 0
+            buffer, row = self.buffers[name], self.counts[name]
+            if row == len(buffer):
+                buffer = self.buffers[name] = torch.cat((buffer, torch.empty_like(buffer)))
+            if torch.is_tensor(value):
+                buffer[row].copy_(value)
+            else:
+                buffer[row] = value
+            self.counts[name] = row + 1
+
+    def result(self):
+        return {name: buffer[:self.counts[name]] for name, buffer in self.buffers.items()}
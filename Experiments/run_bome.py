@@ -11,6 +11,8 @@ toy_lls.f_w        = P.f_w
 toy_lls.g_x        = P.g_x
 toy_lls.g_w        = P.g_w
 toy_lls.g_x_xhat_w = P.g_x_xhat_w
+toy_lls.f_oracle   = P.f_oracle
+toy_lls.g_oracle   = P.g_oracle
 toy_lls.x_star     = P.x_star_alpha   # if toy_lls uses x_star
 
 
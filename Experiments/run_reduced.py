@@ -1,26 +1,54 @@
 import torch, time
-from common_problem import x_star_alpha, f, A
+from common_problem import x_star_alpha, f, f_oracle, hessians, A
 
-def phi_alpha(w, alpha):
+def phi_alpha(w, alpha, problem=None):
     """
     Reduced upper-level objective:
       phi_alpha(w) = f_leader(x_star_alpha(w, alpha), w)
+    problem: a dict with "f" and "x_star_alpha" (e.g. from common_problem.random_problem),
+    common_problem's functions by default
     """
-    x = x_star_alpha(w, alpha)
-    return f(x, w)
-
-def grad_phi_alpha(w, alpha):
-    w_ = w.detach().clone().requires_grad_(True)
-    y = phi_alpha(w_, alpha)
-    (g,) = torch.autograd.grad(y, w_)
-    return g
-L = 2 + 0.4 * (torch.linalg.svdvals(A).max()**2)
+    x_star, f_ = (x_star_alpha, f) if problem is None else (problem["x_star_alpha"], problem["f"])
+    x = x_star(w, alpha)
+    return f_(x, w)
+
+def phi_and_grad_alpha(w, alpha, problem=None):
+    """
+    phi_alpha(w) and its gradient in one pass: the fused oracle gives f and both
+    partial gradients at x = x_star_alpha(w, alpha), and the chain rule adds
+    the vector-Jacobian product of x_star_alpha:
+      grad phi_alpha(w) = f_w + (d x_star_alpha / dw)^T f_x
+    problem: as in phi_alpha, with an "f_oracle" as well
+    """
+    x_star, oracle_ = (x_star_alpha, f_oracle) if problem is None else (problem["x_star_alpha"], problem["f_oracle"])
+    w_ = w.detach()
+    x, x_star_vjp = torch.func.vjp(lambda w: x_star(w, alpha), w_)
+    value, fx, fw = oracle_(x, w_)
+    (fx_w,) = x_star_vjp(fx)
+    return value, fw + fx_w
+
+def grad_phi_alpha(w, alpha, problem=None):
+    return phi_and_grad_alpha(w, alpha, problem)[1]
+
+def reduced_lipschitz(alpha=0.0):
+    """
+    Largest eigenvalue of the Hessian of phi_alpha, with J = d x_star_alpha / dw:
+      J^T f_xx J + J^T f_xw + f_xw^T J + f_ww
+    (exact for a quadratic f and a linear x_star_alpha; the Hessian blocks come
+    from the analytic backend when f has one, and alpha = 0 gives the largest J)
+    """
+    w0 = torch.zeros(A.shape[1])
+    J = torch.func.jacfwd(x_star_alpha)(w0, alpha)
+    f_xx, f_xw, f_ww = hessians(f)(x_star_alpha(w0, alpha), w0)
+    return torch.linalg.eigvalsh(J.T @ f_xx @ J + J.T @ f_xw + f_xw.T @ J + f_ww).max()
+
+L = reduced_lipschitz()          # = 2 + 0.4 * ||A||^2 for common_problem
 default_step = 0.9 / L       # safe choice
 
 
 
 def run_reduced(alpha0=1.0, delta=0.5, step=default_step,
-                max_inner=50, tol_inner=1e-8, tol_outer=1e-4):
+                max_inner=50, tol_inner=1e-8, tol_outer=1e-4, w0=None, problem=None):
     
     #Outer loop on alpha, inner (approximate) gradient descent on theta_alpha(w)=f(x_alpha(w),w).
       #alpha0:    initial regularization weight
@@ -29,36 +57,38 @@ def run_reduced(alpha0=1.0, delta=0.5, step=default_step,
       #max_inner: max inner GD iters on w per alpha
       #tol_inner: stop inner when ‖grad_phi_alpha‖<tol_inner
       #tol_outer: stop outer when alpha<tol_outer
+      #w0:        starting point (default (-2, 5) for common_problem)
+      #problem:   dict with "f", "x_star_alpha" and "f_oracle" to solve instead of common_problem
     
 
     # initialize w and alpha
     # w = torch.tensor([6., -7.], requires_grad=True)
-    w = torch.tensor([-2., 5.], requires_grad=True)
+    w = torch.tensor([-2., 5.]) if w0 is None else w0.detach().clone()
 
     alpha = alpha0
 
     # storage for plotting
-    Ws, Phis, Alphas = [], [], []
+    Ws, Phis, Alphas, Ts = [], [], [], []
     t0 = time.time() #to keep track of time
 
     # Outer loop: shrink alpha until it is small
     while alpha > tol_outer:
         # Inner loop: descend on phi_alpha(y) with back‑tracking line‑search
         for _ in range(max_inner):
-            # compute gradient of the reduced objective phi_alpha at current y
-            g = grad_phi_alpha(w, alpha)
+            # compute phi_alpha and its gradient at current w
+            phi0, g = phi_and_grad_alpha(w, alpha, problem)
 
             # record current state
             Ws.append(w.clone())
-            Phis.append(phi_alpha(w, alpha).item())
+            Phis.append(phi0.item())
             Alphas.append(alpha)
+            Ts.append(time.time() - t0)
 
             # stopping check: if gradient is tiny, break
             if g.norm() < tol_inner:
                 break
 
             # --------- Armijo back‑tracking line‑search on w ---------
-            phi0 = phi_alpha(w, alpha)        # current phi_alpha,w
             dir  = -g                         # descent direction
             t    = step                       # initial trial step‑size
             beta, sigma = 0.5, 1e-4           # shrink factor & Armijo constant
@@ -69,8 +99,8 @@ def run_reduced(alpha0=1.0, delta=0.5, step=default_step,
 
             # shrink t until sufficient decrease holds
             while True:
-                w_new = (w + t * dir).detach().requires_grad_(True)
-                if phi_alpha(w_new, alpha) <= rhs:
+                w_new = (w + t * dir).detach()
+                if phi_alpha(w_new, alpha, problem) <= rhs:
                     break
                 t *= beta
                 rhs = phi0 + sigma * t * dg
@@ -88,6 +118,6 @@ def run_reduced(alpha0=1.0, delta=0.5, step=default_step,
     # package results
     Ws = torch.stack(Ws)
     Phis = torch.tensor(Phis)
-    Ts = torch.linspace(0, time.time() - t0, len(Ws))
+    Ts = torch.tensor(Ts)
 
     return {'w': Ws, 'f': Phis, 'alpha': torch.tensor(Alphas), 't': Ts}
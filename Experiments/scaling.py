@@ -0,0 +1,122 @@
+import time
+import torch
+import matplotlib.pyplot as plt
+
+from toy_lls import bilevel_descent_bome
+from run_reduced import run_reduced, phi_alpha
+from common_problem import random_problem
+
+#--- scaling of BOME and the reduced method with the dimension n ---
+# Both solvers run on random_problem(n, cond, layers) instances and are timed to a fixed
+# suboptimality of the reduced objective phi_0(w) = f(x_star_alpha(w, 0), w), whose optimal
+# value the generator gives in closed form (BOME is scored on its w iterates as well).
+# The solvers run in float32; their iterates are scored in float64 on the same instance,
+# so that the gaps are not swamped by the rounding of phi (which grows with n).
+ns = [2, 10, 100, 1000, 10000, 100000]
+cond = 100.0
+layers = 2
+rel_tol = 1e-3          # target: phi_0(w) - phi* <= rel_tol * (1 + |phi*|)
+
+# solver budgets
+bome_iters = 5000
+bome_stride = 10        # record every 10th iterate, so the w trajectory stays small at large n
+bome_k = 10
+bome_xhat_lr = 1.0      # g_xx = I, so an inner step of 1 solves the lower level exactly
+alpha0, delta = 1.0, 0.5
+max_inner, tol_inner, tol_outer = 50, 1e-8, 1e-4
+
+# BOME's step size (x_lr = w_lr) and eta are tuned for every n on another instance of the same size (seed 1):
+# the pair whose gap stays within the target soonest in tune_iters iterations (or, if none gets there, the one
+# with the smallest final gap) is then run on the scored instance (seed 0).
+# The reduced method needs no tuning, its Armijo line search starts from 0.9 / L.
+bome_grid = [(lr, eta) for lr in (0.03, 0.1, 0.3) for eta in (0.1, 0.5)]
+tune_iters = 1000
+
+
+def gaps(problem64, ws):
+    # phi_0(w) - phi* for every row of ws, in float64
+    return [phi_alpha(w.double(), 0.0, problem64).item() - problem64["optimal_value"] for w in ws]
+
+
+def time_to_target(problem64, ts, ws):
+    # first recorded time at which the gap is within the target, and the time from which it stays there
+    # (None if never)
+    target = rel_tol * (1 + abs(problem64["optimal_value"]))
+    within = [gap <= target for gap in gaps(problem64, ws)]
+    first = next((t for t, ok in zip(ts.tolist(), within) if ok), None)
+    settled = None
+    for t, ok in zip(reversed(ts.tolist()), reversed(within)):
+        if not ok:
+            break
+        settled = t
+    return first, settled
+
+
+def run_bome(problem, lr, eta, iters):
+    x = torch.zeros(problem["n"], requires_grad=True)
+    w = problem["w0"].clone().requires_grad_(True)
+    # res['w'] starts with the initial point, res['t'] with the first recorded iteration
+    res = bilevel_descent_bome(x, w, x_lr=lr, w_lr=lr, xhat_lr=bome_xhat_lr, k=bome_k, maxIter=iters,
+                               eta=eta, record_stride=bome_stride, record_fields=('w', 't'),
+                               oracles=(problem["f_oracle"], problem["g_oracle"]))
+    return res['t'], res['w'][1:]
+
+
+def tune_bome(n):
+    problem = random_problem(n, cond=cond, layers=layers, seed=1)
+    problem64 = random_problem(n, cond=cond, layers=layers, seed=1, dtype=torch.float64)
+    score = {}
+    for lr, eta in bome_grid:
+        ts, ws = run_bome(problem, lr, eta, tune_iters)
+        _, settled = time_to_target(problem64, ts, ws)
+        score[(lr, eta)] = (0, settled) if settled is not None else (1, gaps(problem64, ws[-1:])[0])
+    return min(score, key=lambda setting: score[setting])
+
+
+results = {"bome": [], "reduced": []}
+table = []
+for n in ns:
+    problem = random_problem(n, cond=cond, layers=layers, seed=0)
+    problem64 = random_problem(n, cond=cond, layers=layers, seed=0, dtype=torch.float64)
+
+    lr, eta = tune_bome(n)
+    t0 = time.time()
+    ts, ws = run_bome(problem, lr, eta, bome_iters)
+    total = time.time() - t0
+    results["bome"].append((n, *time_to_target(problem64, ts, ws), gaps(problem64, ws[-1:])[0], total,
+                            f"lr={lr:g}, eta={eta:g}"))
+
+    step = 0.9 / problem["L"]
+    t0 = time.time()
+    res = run_reduced(alpha0=alpha0, delta=delta, step=step, max_inner=max_inner,
+                      tol_inner=tol_inner, tol_outer=tol_outer, w0=problem["w0"], problem=problem)
+    total = time.time() - t0
+    results["reduced"].append((n, *time_to_target(problem64, res['t'], res['w']), gaps(problem64, res['w'][-1:])[0],
+                               total, f"step={step:.3g}"))
+
+    for method in results:
+        _, first, settled, gap, total, settings = results[method][-1]
+        first = f"{first:.3f}s" if first is not None else "never"
+        settled = f"{settled:.3f}s" if settled is not None else "never"
+        table.append(f"n={n:>6d}  {method:>7s} ({settings:<18s})  reaches target {first:>8s}  stays from {settled:>8s}  "
+                     f"final gap {gap:.2e}  total {total:.2f}s")
+        print(table[-1])
+
+torch.save(results, "scaling_result.pt")
+with open("scaling_result.txt", "w") as file:
+    file.write(f"time to rel. suboptimality {rel_tol:g}, cond(A) = {cond:g}, gaps in float64\n")
+    file.write("\n".join(table) + "\n")
+
+plt.figure(figsize=(8,6))
+for method, rows in results.items():
+    reached = [(n, settled) for (n, _, settled, _, _, _) in rows if settled is not None]
+    plt.plot([n for n, _ in reached], [settled for _, settled in reached], 'o-', label=method)
+plt.xscale('log')
+plt.yscale('log')
+plt.xlabel('n')
+plt.ylabel(f'time until rel. suboptimality stays below {rel_tol:g} (s)')
+plt.title(f"Scaling with dimension, cond(A) = {cond:g}, ≤ {2**layers} nonzeros per row")
+plt.legend()
+plt.tight_layout()
+plt.savefig("scaling.png")
+plt.show()
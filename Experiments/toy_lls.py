@@ -11,7 +11,10 @@ import matplotlib.pyplot as plt
 
 from scipy.spatial import ConvexHull
 from common_problem import (f, g, f_x, f_w, g_x, g_w,
-                            g_x_xhat_w, x_star_alpha)
+                            g_x_xhat_w, x_star_alpha, f_oracle, g_oracle)
+from recorder import TrajectoryRecorder
+import bome_batched
+from bome_batched import per_trajectory, split_batched
 
 
 ################################################################################
@@ -35,18 +38,17 @@ from common_problem import (f, g, f_x, f_w, g_x, g_w,
 LOWER = -100
 UPPER = 100
 
-def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
-    xs, ws, fs, gs, xhats, times = [], [], [], [], [], []
-
-    gg = []
+def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, record_stride=1, record_fields=None, oracles=None):
+    # oracles: (f_oracle, g_oracle) of the problem to solve, this module's ones by default
+    f_or, g_or = (f_oracle, g_oracle) if oracles is None else oracles
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
 
     xhat = copy.deepcopy(x)
     x_opt = torch.optim.SGD([x], lr=x_lr)
     w_opt = torch.optim.SGD([w], lr=w_lr)
     xhat_opt = torch.optim.SGD([xhat], lr=xhat_lr)
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     n_params_x = x.numel()
     n_params_w = w.numel()
@@ -60,19 +62,17 @@ def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
         xhat.data = x.data.clone()
         for j in range(k):
             xhat_opt.zero_grad()
-            xhat.grad = g_x(xhat, w).data
+            xhat.grad = g_or(xhat, w)[1]
             xhat_opt.step()
             xhat.data.clamp_(LOWER, UPPER)
 
-        xhats.append(xhat.data.clone().view(-1).cpu())
-        g_gap = (g(x, w) - g(xhat, w)).data.clone()
-        gg.append(g(x,w).view(-1).clone().cpu())
-        
-        # prepare gradients 
-        fx = f_x(x, w)
-        fw = f_w(x, w)
+        # prepare gradients, one fused pass per function and point
+        _, fx, fw = f_or(x, w)
+        g_x_w, gx, gw = g_or(x, w)
+        g_xhat_w, _, gw_xhat = g_or(xhat, w)
+        gw_minus_gw_k = gw - gw_xhat
 
-        loss, gx, gw_minus_gw_k = g_x_xhat_w(x, xhat, w)
+        g_gap = g_x_w - g_xhat_w
 
         df[:n_params_x].copy_(fx.view(-1).clone())
         dg[:n_params_x].copy_(gx.view(-1).clone())
@@ -94,31 +94,24 @@ def bilevel_descent_bome(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta):
         t1 = time.time()
         t += t1-t0
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
-        times.append(t)
-
-    res = { 
-        'x'   : torch.vstack(xs),
-        'xhat': torch.vstack(xhats),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-        't'  : torch.Tensor(times).view(-1),
-        'gg' : torch.vstack(gg).view(-1),
-    }
-    return res 
+        if rec.due(i):
+            rec.record(x=x.view(-1), xhat=xhat.view(-1), w=w.view(-1),
+                       f=f_or(x, w)[0], g=g_gap, t=t, gg=g_x_w)
+
+    return rec.result()
 
 
-def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
-    xs, ws, fs, gs = [], [], [], []
-    gg = []
-    times = []
+def bilevel_descent_bome_batched(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, record_stride=1, record_fields=None, oracles=None):
+    # the shared batched bome (bome_batched.py) on this module's oracles, clamped to [LOWER, UPPER] like bilevel_descent_bome;
+    # the oracles are looked up at call time, so run_bome's overrides apply, and oracles=(f_oracle, g_oracle) replaces them
+    f_or, g_or = (f_oracle, g_oracle) if oracles is None else oracles
+    return bome_batched.bilevel_descent_bome_batched(x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta, f_or, g_or,
+                                                     record_stride, record_fields, bounds=(LOWER, UPPER))
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+
+def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
     w_opt = torch.optim.SGD([w], lr=w_lr)
     x_opt = torch.optim.SGD([x], lr=x_lr)
 
@@ -126,20 +119,17 @@ def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
     for i in range(maxIter):
 
         t0 = time.time()
-        g0 = g(x,w).data.clone()
+        g0 = g_oracle(x, w)[0]
         for it in range(k):
             x_opt.zero_grad()
-            x.grad = g_x(x, w).data
+            x.grad = g_oracle(x, w)[1]
             x_opt.step()
             x.data.clamp_(LOWER, UPPER)
-        g_gap = g0 - g(x,w).data.clone()
-        gg.append(g(x,w).data.clone().view(-1).cpu())
 
         # prepare gradients 
-        fx = f_x(x, w)
-        fw = f_w(x, w)
-        gx = g_x(x, w)
-        gw = g_w(x, w)
+        _, fx, fw = f_oracle(x, w)
+        g_x_w, gx, gw = g_oracle(x, w)
+        g_gap = g0 - g_x_w
 
         w_opt.zero_grad()
         w.grad = (fw - fx.view(-1).dot(gx.view(-1)) / (gx.view(-1).dot(gx.view(-1))+1e-8) * gw).data
@@ -147,40 +137,25 @@ def BSG_1(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500):
         t1 = time.time()
         t += t1-t0
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
-        times.append(t)
-
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-        't'   : torch.Tensor(times).view(-1),
-        'gg'  : torch.Tensor(gg).view(-1),
-    }
-    return res 
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f_oracle(x, w)[0], g=g_gap, t=t, gg=g_x_w)
+
+    return rec.result()
 
 
 def calculate_g_gap(x, w, lr, k):
     x_ = copy.deepcopy(x)
-    g0 = g(x, w).data.clone()
+    g0 = g_oracle(x, w)[0]
     for j in range(k):
-        x_.data = x_.data - lr * g_x(x_, w).data.clone()
+        x_.data = x_.data - lr * g_oracle(x_, w)[1]
         x_.data.clamp_(LOWER, UPPER)
-    gnow = g(x_, w).data.clone()
+    gnow = g_oracle(x_, w)[0]
     return g0 - gnow
     
 
-def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
-    xs, ws, fs, gs = [], [], [], []
-    times = []
-    gg = []
-
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
 
     z_l2_reg_coef = l2_reg
     y_l2_reg_coef = l2_reg
@@ -194,7 +169,8 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
 
     t = 0
     for i in range(maxIter):
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if rec.due(i) and rec.wants('g') else None
 
         t0 = time.time()
         reg_decay_rate = 1 / (math.log(decay_rate * (maxIter+1)))
@@ -216,7 +192,7 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
             x_opt.step()
             x.data.clamp_(LOWER, UPPER)
 
-        gg.append(g(x,w).data.clone().cpu().view(-1))
+        g_x_w = g(x,w).data.clone()
 
         w_opt.zero_grad()
         loss_x = g(x, w)
@@ -229,30 +205,15 @@ def BVFSM(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, l2_reg=0.1, ln_reg=1):
         t1 = time.time()
         t += t1-t0
 
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
-        times.append(t)
-
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-        't'   : torch.Tensor(times).view(-1),
-        'gg'  : torch.vstack(gg).view(-1),
-    }
-    return res 
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap, t=t, gg=g_x_w)
 
+    return rec.result()
 
-def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamma=0.1):
-    xs, ws, fs, gs = [], [], [], []
-    times = []
-    gg = []
 
-    xs.append(x.data.clone().view(-1))
-    ws.append(w.data.clone().view(-1))
+def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamma=0.1, record_stride=1, record_fields=None):
+    rec = TrajectoryRecorder(maxIter, record_stride, record_fields)
+    rec.record(x=x.view(-1), w=w.view(-1))
     t = 0
 
     def penalty_gx(x, w, gamma_k, nu_k):
@@ -281,7 +242,8 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamm
 
     for i in range(maxIter):
 
-        g_gap = calculate_g_gap(x, w, xhat_lr, k)
+        # the g gap is only needed for the record
+        g_gap = calculate_g_gap(x, w, xhat_lr, k) if rec.due(i) and rec.wants('g') else None
         t0 = time.time()
         for j in range(k):
             x_opt.zero_grad()
@@ -295,7 +257,7 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamm
         w.grad = grad.data
         w_opt.step()
 
-        gg.append(g(x,w).data.clone().view(-1).cpu())
+        g_x_w = g(x,w).data.clone()
 
         if gx_norm**2 + gw_norm**2 < eps**2:
             gamma *= c_gamma
@@ -309,23 +271,12 @@ def penalty(x, w, x_lr, w_lr, xhat_lr, k, maxIter=500, lmbd_g=0.1, eps=0.1, gamm
             print("update gamma and eps", gamma, eps)
 
         t1 = time.time()
-
-        xs.append(x.data.clone().view(-1).cpu())
-        ws.append(w.data.clone().view(-1).cpu())
-        fs.append(f(x,w).data.clone().view(-1).cpu())
-        gs.append(g_gap.clone().view(-1).cpu())
         t += t1-t0
-        times.append(t)
-
-    res = { 
-        'x'   : torch.vstack(xs),
-        'w'   : torch.vstack(ws),
-        'f'   : torch.vstack(fs).view(-1),
-        'g'   : torch.vstack(gs).view(-1),
-        't'   : torch.Tensor(times).view(-1),
-        'gg'  : torch.Tensor(gg).view(-1),
-    }
-    return res
+
+        if rec.due(i):
+            rec.record(x=x.view(-1), w=w.view(-1), f=f(x,w), g=g_gap, t=t, gg=g_x_w)
+
+    return rec.result()
 
 
 def plotme(res, xcts0, xcts, name): 
@@ -419,7 +370,7 @@ if __name__ == "__main__":
     control_seed(seed)
 
     x = torch.FloatTensor([0,0]).requires_grad_()
-    w = torch.FloatTensor([0]).requires_grad_()
+    w = torch.FloatTensor([0,0]).requires_grad_()
     x_data = x.data.clone()
     w_data = w.data.clone()
 
@@ -477,24 +428,25 @@ if __name__ == "__main__":
     results['method'][method] = res
     print(method, x, w)
 
+    # the k and eta sweeps of bome run as one batch each, one trajectory per setting
     method = "bome"
     eta = 0.5
-    for k, maxIter in zip([1, 10, 100], [1000, 1000, 1000]):
-        x.data = x_data.clone()
-        w.data = w_data.clone()
-        res = fn_maps[method](x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta)
-        results['iter'][k] = res
-        print(method, k, x, w)
+    ks = [1, 10, 100]
+    maxIter = 1000
+    res = bilevel_descent_bome_batched(x_data.expand(len(ks), -1), w_data.expand(len(ks), -1),
+                                       x_lr, w_lr, xhat_lr, ks, maxIter, eta)
+    for k, r in zip(ks, split_batched(res)):
+        results['iter'][k] = r
+        print(method, k, r['x'][-1], r['w'][-1])
 
     method = "bome"
-    eta = 0.5
+    etas = [0.1, 0.5, 0.9]
     maxIter =  5000
     k = 10
-    for eta in [0.1, 0.5, 0.9]:
-        x.data = x_data.clone()
-        w.data = w_data.clone()
-        res = fn_maps[method](x, w, x_lr, w_lr, xhat_lr, k, maxIter, eta)
-        results['eta'][eta] = res
-        print(method, eta, x, w)
+    res = bilevel_descent_bome_batched(x_data.expand(len(etas), -1), w_data.expand(len(etas), -1),
+                                       x_lr, w_lr, xhat_lr, k, maxIter, etas)
+    for eta, r in zip(etas, split_batched(res)):
+        results['eta'][eta] = r
+        print(method, eta, r['x'][-1], r['w'][-1])
 
     torch.save(results, "D:/BOME/Results 2025/toy_lls_result.pt")
@@ -0,0 +1,2301 @@
+#Linear bilevel programs solved through the KKT reformulation of the lower level (big-M MILP) and related methods
+#This module holds everything Bilevel_MILP.ipynb runs, so that it can be imported by benchmark runners, worker processes and profilers
+#Run as a script to solve instance files: python bilevel_milp.py --help
+
+import numpy as np
+import scipy.sparse as sp
+import cvxpy as cvx
+from scipy.optimize import linprog, milp, LinearConstraint, Bounds
+try:
+    import highspy
+except ImportError:
+    highspy = None
+import argparse
+import glob
+import gzip
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import warnings
+
+
+def solve_LP(x,y,u,objective_expression=None,constraints=None):
+
+    #Helper Function: Solves the Linear Program containing upper variable x, lower variable y, dual variable mu required by MILP problem
+    #Objective_expression and constraints are written as cvx expressions
+    #Returns: cvx problem, x optimal, y optimal, u optimal
+    
+    objective = cvx.Minimize(objective_expression)
+    prob = cvx.Problem(objective,constraints)
+    prob.solve()
+    return prob,x.value,y.value,u.value
+
+
+def BLP_compile(A,B,C,D,s,t,upper_obj,lower_obj,M,p2=0,q2=0):
+
+    #Helper Function: Compiles the MILP KKT reformulation into solver matrices once, so that no model is rebuilt per linear program
+    #The variable vector is [x, y, u, zeta, eta]; the 0-1 variables are ordinary columns whose bounds select the assignment
+    #Fixing zeta/eta to 0 or 1 (or relaxing them to [0,1]) then only changes the bound vector handed to the solver
+    #The last p2 rows of A, B, s and the last q2 rows of C, D, t are equality constraints
+    #Lower level equalities are kept as equalities with a free dual variable (the last q2 entries of u) and no 0-1 variable
+    #M is either one big-M constant or the dictionary of per-constraint big-Ms from BLP_big_M
+    #Returns: a dictionary holding the objective, the sparse constraint matrices with their right-hand sides, the default bounds and the variable slices
+
+    n = np.shape(A)[1]
+    m = np.shape(D)[1]
+    p = np.shape(A)[0] - p2
+    q = np.shape(D)[0] - q2
+    r = q + q2
+
+    M = BLP_big_M_vectors(M,m,q)
+    I_m = sp.identity(m)
+    I_q = sp.identity(q)
+    Z = lambda rows, cols: sp.csr_matrix((rows,cols))
+    C_ineq, D_ineq, t_ineq = C[:q], D[:q], t[:q]
+
+    A_ub = sp.bmat([
+        [A[:p], B[:p], Z(p,r), Z(p,m), Z(p,q)],                     #Upper level inequality constraints
+        [C_ineq, D_ineq, Z(q,r), Z(q,m), Z(q,q)],                   #Lower level inequality constraints
+        [Z(m,n), Z(m,m), -D.T, Z(m,m), Z(m,q)],                     #u.T @ D >= -lower_obj[1]
+        [Z(m,n), Z(m,m), D.T, -sp.diags(M["reduced_cost"]), Z(m,q)],#lower_obj[1] + u.T @ D <= M*zeta
+        [Z(m,n), I_m, Z(m,r), sp.diags(M["y"]), Z(m,q)],            #y <= M*(1-zeta)
+        [Z(q,n), Z(q,m), sp.hstack((I_q,Z(q,q2))), Z(q,m), -sp.diags(M["u"])], #u <= M*eta
+        [-C_ineq, -D_ineq, Z(q,r), Z(q,m), sp.diags(M["slack"])],   #t - C @ x - D @ y <= M*(1-eta)
+    ],format="csr")
+    b_ub = np.concatenate((s[:p], t_ineq, lower_obj[1], -lower_obj[1], M["y"], np.zeros(q), M["slack"] - t_ineq))
+
+    A_eq = sp.bmat([
+        [A[p:], B[p:], Z(p2,r), Z(p2,m), Z(p2,q)],                  #Upper level equality constraints
+        [C[q:], D[q:], Z(q2,r), Z(q2,m), Z(q2,q)],                  #Lower level equality constraints
+    ],format="csr")
+    b_eq = np.concatenate((s[p:], t[q:]))
+
+    c = np.concatenate((upper_obj[0], upper_obj[1], np.zeros(r+m+q)))
+    lower = np.concatenate((-np.inf*np.ones(n+m), np.zeros(q), -np.inf*np.ones(q2), np.zeros(m+q)))
+    upper = np.concatenate((np.inf*np.ones(n+m+r), np.ones(m+q)))
+
+    #A big-M of 0 means its side of the pair is always 0, so the constraint holds for either value of the binary:
+    #the binary is fixed to the value that leaves the other side free (zeta=0 for the reduced cost, zeta=1 for y,
+    #eta=0 for u, eta=1 for the slack) in the default bounds, so the MILP backend never branches on it
+    #(the other searches set the binaries themselves, and either value of such a binary is correct there)
+    binaries = slice(n+m+r,n+m+r+m+q)
+    zero_side = np.concatenate((M["reduced_cost"] == 0, M["u"] == 0))
+    one_side = np.concatenate((M["y"] == 0, M["slack"] == 0)) & ~zero_side
+    upper[binaries][zero_side] = 0
+    lower[binaries][one_side] = 1
+
+    return {"c": c, "c0": float(np.sum(upper_obj[2])), "A_ub": A_ub, "b_ub": b_ub, "A_eq": A_eq, "b_eq": b_eq,
+            "lower": lower, "upper": upper,
+            "x": slice(0,n), "y": slice(n,n+m), "u": slice(n+m,n+m+r), "binaries": binaries,
+            "C": C, "D": D, "t": t, "lower_obj": lower_obj, "n": n, "m": m, "q": q}
+
+
+def BLP_compile_lazy(A,B,C,D,s,t,upper_obj,lower_obj,p2=0,q2=0):
+
+    #Helper Function: Compiles the relaxed KKT system without big-M constraints or 0-1 variables, for lazy branching on complementarity
+    #The variable vector is [x, y, u, r, slack], with the reduced costs r = lower_obj[1] + D.T @ u >= 0 and the lower level slacks
+    #slack = t - C @ x - D @ y >= 0 as columns of their own, so that each side of a complementarity pair is a single column
+    #The linear program is the KKT system with every complementarity pair dropped; branching restores a pair by bounding one of its
+    #columns by 0 (see BLP_bounds), so only the pairs violated at a relaxed optimum ever get branched on, and no big-M is needed
+    #Returns: a dictionary in the format of BLP_compile, with the pair columns under "pairs" instead of the 0-1 columns under "binaries"
+
+    n = np.shape(A)[1]
+    m = np.shape(D)[1]
+    p = np.shape(A)[0] - p2
+    q = np.shape(D)[0] - q2
+    r = q + q2
+    Z = lambda rows, cols: sp.csr_matrix((rows,cols))
+
+    A_ub = sp.hstack((A[:p],B[:p],Z(p,r+m+q)),format="csr")          #Upper level inequality constraints
+    b_ub = s[:p]
+    A_eq = sp.bmat([
+        [A[p:], B[p:], Z(p2,r), Z(p2,m), Z(p2,q)],                  #Upper level equality constraints
+        [C[:q], D[:q], Z(q,r), Z(q,m), sp.identity(q)],             #C @ x + D @ y + slack = t
+        [C[q:], D[q:], Z(q2,r), Z(q2,m), Z(q2,q)],                  #Lower level equality constraints
+        [Z(m,n), Z(m,m), D.T, -sp.identity(m), Z(m,q)],             #D.T @ u - r = -lower_obj[1]
+    ],format="csr")
+    b_eq = np.concatenate((s[p:], t[:q], t[q:], -lower_obj[1]))
+
+    c = np.concatenate((upper_obj[0], upper_obj[1], np.zeros(r+m+q)))
+    lower = np.concatenate((-np.inf*np.ones(n+m), np.zeros(q), -np.inf*np.ones(q2), np.zeros(m+q)))
+    upper = np.inf*np.ones(n+m+r+m+q)
+
+    y_cols = np.arange(n,n+m)
+    u_cols = np.arange(n+m,n+m+q)
+    r_cols = np.arange(n+m+r,n+m+r+m)
+    slack_cols = np.arange(n+m+r+m,n+m+r+m+q)
+    return {"c": c, "c0": float(np.sum(upper_obj[2])), "A_ub": A_ub, "b_ub": b_ub, "A_eq": A_eq, "b_eq": b_eq,
+            "lower": lower, "upper": upper,
+            "x": slice(0,n), "y": slice(n,n+m), "u": slice(n+m,n+m+r),
+            "pairs": {"one": np.concatenate((y_cols,slack_cols)), "zero": np.concatenate((r_cols,u_cols))},
+            "C": C, "D": D, "t": t, "lower_obj": lower_obj, "n": n, "m": m, "q": q}
+
+
+def BLP_big_M(A,B,C,D,s,t,lower_obj,M,p2=0,q2=0,margin=1e-6,min_M=1e-3):
+
+    #Helper Function: Derives an individual big-M for every 0-1 constraint by optimization-based bound tightening
+    #Each bound is the optimal value of a linear program over a relaxation that contains every bilevel feasible point:
+        #y_i and the slack t_i - C_i @ x - D_i @ y are maximized over the shared constraint polyhedron of both levels
+        #u_i and the reduced cost lower_obj[1][i] + (u.T @ D)[i] are maximized over the dual feasible set of the lower level
+    #If one of these linear programs is unbounded (typical for the dual feasible set) the constant M is kept for that entry
+    #A bound of 0 (up to margin) is returned as exactly 0 and BLP_compile fixes the paired binary, since a constraint like u_i <= 1e-6*eta_i
+    #is below the solver tolerances and lets HiGHS report a wrong optimum; every other big-M is at least min_M
+    #Returns: dictionary of big-M vectors "reduced_cost", "y" (size m), "u", "slack" (size q), and the number of entries that kept M
+
+    n = np.shape(A)[1]
+    m = np.shape(D)[1]
+    p = np.shape(A)[0] - p2
+    q = np.shape(D)[0] - q2
+
+    #Shared constraint polyhedron of both levels, over [x, y]
+    P_ub = sp.vstack((sp.hstack((A[:p],B[:p])),sp.hstack((C[:q],D[:q]))),format="csr")
+    P_eq = sp.vstack((sp.hstack((A[p:],B[p:])),sp.hstack((C[q:],D[q:]))),format="csr")
+    P = {"A_ub": P_ub, "b_ub": np.concatenate((s[:p],t[:q])), "A_eq": P_eq, "b_eq": np.concatenate((s[p:],t[q:])),
+         "bounds": np.column_stack((-np.inf*np.ones(n+m),np.inf*np.ones(n+m)))}
+
+    #Dual feasible set of the lower level, over u: u.T @ D >= -lower_obj[1], inequality duals nonnegative, equality duals free
+    #Lower level inequalities without y do not enter u.T @ D, so their duals can always be taken to be zero
+    u_upper = np.inf*np.ones(q+q2)
+    u_upper[:q][np.asarray(abs(D[:q]).sum(axis=1)).ravel() == 0] = 0
+    Q = {"A_ub": -D.T, "b_ub": np.array(lower_obj[1],dtype=float), "A_eq": None, "b_eq": None,
+         "bounds": np.column_stack((np.concatenate((np.zeros(q),-np.inf*np.ones(q2))),u_upper))}
+
+    def maximize(region,direction,offset):
+        if region["A_eq"] is not None and len(region["b_eq"]) > 0:
+            res = linprog(-direction,A_ub=region["A_ub"],b_ub=region["b_ub"],A_eq=region["A_eq"],b_eq=region["b_eq"],bounds=region["bounds"],method="highs")
+        else:
+            res = linprog(-direction,A_ub=region["A_ub"],b_ub=region["b_ub"],bounds=region["bounds"],method="highs")
+        if res.status != 0:
+            return np.inf
+        #A small safety margin keeps solver tolerances from cutting off feasible points; a big-M is never negative
+        value = offset - res.fun
+        if value <= margin:
+            return 0.0
+        return max(value + margin*(1+value),min_M)
+
+    bounds = {
+        "reduced_cost": np.array([maximize(Q,D[:,[i]].toarray().ravel(),lower_obj[1][i]) for i in range(m)]),
+        "y": np.array([maximize(P,np.eye(n+m)[n+i],0) for i in range(m)]),
+        "u": np.array([maximize(Q,np.eye(q+q2)[i],0) for i in range(q)]),
+        "slack": np.array([maximize(P,-P_ub[p+i].toarray().ravel(),t[i]) for i in range(q)]),
+    }
+
+    fallback = 0
+    for key in bounds:
+        fallback += int(np.sum(np.isinf(bounds[key])))
+        bounds[key][np.isinf(bounds[key])] = M
+    return bounds, fallback
+
+
+def BLP_big_M_vectors(M,m,q):
+
+    #Helper Function: Expands a single big-M constant into the per-constraint dictionary returned by BLP_big_M
+
+    if isinstance(M,dict):
+        return M
+    return {"reduced_cost": M*np.ones(m), "y": M*np.ones(m), "u": M*np.ones(q), "slack": M*np.ones(q)}
+
+
+def solve_compiled_LP(model,lo,hi,profile=None):
+
+    #Helper Function: Solves the compiled linear program with the 0-1 variables restricted to lo <= [zeta, eta] <= hi
+    #lo == hi fixes an assignment, lo = 0 and hi = 1 relaxes a binary (for the lazy model, see BLP_bounds)
+    #If a profile dictionary is given, the time spent setting the bounds, in linprog and extracting the solution is added to its
+    #"bounds", "solve" and "extract" entries (in seconds), and its "status" is set to the outcome (see BLP_profile)
+    #Any other outcome (iteration limit, numerical failure) raises, since pruning such a program as infeasible could lose the optimum
+    #Returns: optimal value (inf if infeasible, -inf if unbounded), x optimal, y optimal, u optimal (None unless solved)
+
+    profile = {} if profile is None else profile
+    tic = time.perf_counter()
+    lower, upper = BLP_bounds(model,lo,hi)
+
+    #Empty constraint blocks are left out (the lazy model has no inequality rows unless the upper level has some)
+    constraints = {}
+    if len(model["b_ub"]) > 0:
+        constraints.update(A_ub=model["A_ub"],b_ub=model["b_ub"])
+    if len(model["b_eq"]) > 0:
+        constraints.update(A_eq=model["A_eq"],b_eq=model["b_eq"])
+    bounds = np.column_stack((lower,upper))
+    toc = time.perf_counter()
+    profile["bounds"] = profile.get("bounds",0) + toc - tic
+    res = linprog(model["c"],bounds=bounds,method="highs",**constraints)
+    tic = time.perf_counter()
+    profile["solve"] = profile.get("solve",0) + tic - toc
+    profile["status"] = {0: "optimal", 1: "iteration_limit", 2: "infeasible", 3: "unbounded"}.get(res.status,"numerical_error")
+    if res.status == 3:
+        return -np.inf, None, None, None
+    if res.status == 2:
+        return np.inf, None, None, None
+    if res.status != 0:
+        raise Exception(f"Error: Linear program ended with status {profile['status']} ({res.message})")
+    v = res.x
+    solution = res.fun + model["c0"], v[model["x"]], v[model["y"]], v[model["u"]]
+    profile["extract"] = profile.get("extract",0) + time.perf_counter() - tic
+    return solution
+
+
+def BLP_bounds(model,lo,hi):
+
+    #Helper Function: Column bounds of a compiled linear program with the binaries restricted to lo <= [zeta, eta] <= hi
+    #In the big-M model (BLP_compile) the binaries are columns themselves
+    #The lazy model (BLP_compile_lazy) has no 0-1 columns; a binary fixed to 1 instead bounds the "one" side of its complementarity pair
+    #(y_i <= 0 for zeta_i, the slack of the lower level constraint for eta_i) by 0, and a binary fixed to 0 bounds the "zero" side
+    #(the reduced cost for zeta_i, u_i for eta_i) by 0; free binaries leave their pair unconstrained
+    #Returns: lower and upper bounds of every column
+
+    lower = model["lower"].copy()
+    upper = model["upper"].copy()
+    if "pairs" in model:
+        upper[model["pairs"]["one"][np.asarray(lo) == 1]] = 0
+        upper[model["pairs"]["zero"][np.asarray(hi) == 0]] = 0
+    else:
+        lower[model["binaries"]] = lo
+        upper[model["binaries"]] = hi
+    return lower, upper
+
+
+def BLP_warm_LP(model,warm_start=True):
+
+    #Helper Function: Prepares repeated solves of the compiled linear program that differ only in the bounds of the 0-1 variables
+    #The model is loaded once into a HiGHS instance (through highspy) and each solve only changes the bounds of the 0-1 columns
+    #(or, for the lazy model of BLP_compile_lazy, of the complementarity pair columns; see BLP_bounds)
+    #With warm_start, the simplex method restarts from the previous optimal basis; without it, the basis is cleared before every solve
+    #If highspy is not installed, every solve goes through solve_compiled_LP instead and no iteration count is available
+    #solve(lo,hi,profile) fills an optional profile dictionary as solve_compiled_LP does (the "solve" phase is highs.run)
+    #A warm solve that ends in any other state than optimal, infeasible or unbounded (iteration limit, numerical trouble) is repeated
+    #from scratch by solve_compiled_LP, which raises if that fails too
+    #Returns: a function solve(lo,hi,profile=None) giving the optimal value (inf if infeasible, -inf if unbounded),
+    #x, y, u optimal (None unless solved) and the number of simplex iterations used
+
+    if highspy is None:
+        return lambda lo, hi, profile=None: solve_compiled_LP(model,lo,hi,profile) + (None,)
+
+    highs = highspy.Highs()
+    highs.setOptionValue("output_flag",False)
+    highs.setOptionValue("presolve","off")
+    highs.setOptionValue("solver","simplex")
+
+    N = len(model["c"])
+    highs.addVars(N,model["lower"],model["upper"])
+    highs.changeColsCost(N,np.arange(N,dtype=np.int32),model["c"])
+    rows = sp.vstack((model["A_ub"],model["A_eq"]),format="csr")
+    row_lower = np.concatenate((np.full(len(model["b_ub"]),-np.inf),model["b_eq"]))
+    row_upper = np.concatenate((model["b_ub"],model["b_eq"]))
+    highs.addRows(rows.shape[0],row_lower,row_upper,rows.nnz,rows.indptr[:-1].astype(np.int32),rows.indices.astype(np.int32),rows.data)
+
+    if "pairs" in model:
+        columns = np.concatenate((model["pairs"]["one"],model["pairs"]["zero"])).astype(np.int32)
+    else:
+        columns = np.arange(N,dtype=np.int32)[model["binaries"]]
+    statuses = {highspy.HighsModelStatus.kOptimal: "optimal", highspy.HighsModelStatus.kInfeasible: "infeasible",
+                highspy.HighsModelStatus.kUnbounded: "unbounded"}
+    def solve(lo,hi,profile=None):
+        profile = {} if profile is None else profile
+        tic = time.perf_counter()
+        lower, upper = BLP_bounds(model,lo,hi)
+        highs.changeColsBounds(len(columns),columns,lower[columns],upper[columns])
+        if not warm_start:
+            highs.clearSolver()
+        toc = time.perf_counter()
+        profile["bounds"] = profile.get("bounds",0) + toc - tic
+        highs.run()
+        status = highs.getModelStatus()
+        iterations = highs.getInfo().simplex_iteration_count
+        tic = time.perf_counter()
+        profile["solve"] = profile.get("solve",0) + tic - toc
+        profile["status"] = statuses.get(status,highs.modelStatusToString(status).lower().replace(" ","_"))
+        if status == highspy.HighsModelStatus.kUnbounded:
+            return -np.inf, None, None, None, iterations
+        if status == highspy.HighsModelStatus.kInfeasible:
+            return np.inf, None, None, None, iterations
+        if status != highspy.HighsModelStatus.kOptimal:
+            #The simplex method did not tell infeasible and unbounded apart, or did not finish; let linprog (with presolve) decide
+            return solve_compiled_LP(model,lo,hi,profile) + (iterations,)
+        v = np.array(highs.getSolution().col_value)
+        solution = highs.getInfo().objective_function_value + model["c0"], v[model["x"]], v[model["y"]], v[model["u"]], iterations
+        profile["extract"] = profile.get("extract",0) + time.perf_counter() - tic
+        return solution
+    return solve
+
+
+def BLP_elastic(model):
+
+    #Helper Function: Builds the elastic (phase one) version of the compiled linear program, used for conflict analysis
+    #Every inequality row gets a slack e >= 0 and every equality row two slacks e+, e- >= 0, and the objective is their sum
+    #This linear program is always feasible, and its optimal value is positive exactly when the original linear program is infeasible
+    #Returns: dictionary with the objective, constraint matrices, right-hand sides and default bounds of the elastic linear program
+
+    N = len(model["c"])
+    r1 = len(model["b_ub"])
+    r2 = len(model["b_eq"])
+    Z = lambda rows, cols: sp.csr_matrix((rows,cols))
+
+    A_ub = sp.hstack((model["A_ub"],-sp.identity(r1),Z(r1,2*r2)),format="csr")
+    A_eq = sp.hstack((model["A_eq"],Z(r2,r1),sp.identity(r2),-sp.identity(r2)),format="csr")
+    c = np.concatenate((np.zeros(N),np.ones(r1+2*r2)))
+    lower = np.concatenate((model["lower"],np.zeros(r1+2*r2)))
+    upper = np.concatenate((model["upper"],np.inf*np.ones(r1+2*r2)))
+
+    return {"c": c, "A_ub": A_ub, "b_ub": model["b_ub"], "A_eq": A_eq, "b_eq": model["b_eq"], "lower": lower, "upper": upper}
+
+
+def BLP_conflict(model,elastic,assignment,solve,tol=1e-7):
+
+    #Helper Function: Conflict analysis for an infeasible 0-1 assignment
+    #The elastic linear program (see BLP_elastic) is solved with the assignment fixed; binaries whose bounds have a zero marginal
+    #play no part in its dual (Farkas) certificate, so relaxing them to [0,1] keeps the linear program infeasible
+    #The remaining binaries are then filtered one by one: a binary is dropped (relaxed) whenever the linear program stays infeasible without it
+    #The binaries that are left form a minimal infeasible subset: no 0-1 assignment that agrees with it on these entries is feasible
+    #Returns: indices of the conflicting binaries (empty if the linear program is infeasible whatever the binaries,
+    #None if the elastic linear program finds no infeasibility),
+    #number of linear programs spent on the analysis
+
+    N = len(assignment)
+    lower = elastic["lower"].copy()
+    upper = elastic["upper"].copy()
+    lower[model["binaries"]] = assignment
+    upper[model["binaries"]] = assignment
+    res = linprog(elastic["c"],A_ub=elastic["A_ub"],b_ub=elastic["b_ub"],A_eq=elastic["A_eq"],b_eq=elastic["b_eq"],
+                  bounds=np.column_stack((lower,upper)),method="highs")
+    if res.status != 0 or res.fun <= tol:
+        return None, 1
+
+    marginals = np.abs(res.lower.marginals[model["binaries"]]) + np.abs(res.upper.marginals[model["binaries"]])
+    conflict = list(np.flatnonzero(marginals > tol))
+
+    #Deletion filter over the certificate's binaries, with everything outside the current conflict relaxed to [0,1]
+    lo = np.zeros(N)
+    hi = np.ones(N)
+    lo[conflict] = assignment[conflict]
+    hi[conflict] = assignment[conflict]
+    LPs = 2
+    if solve(lo,hi)[0] != np.inf:
+        #Numerically the certificate was too small; start the filter from the whole assignment instead
+        conflict = list(range(N))
+        lo, hi = assignment.copy(), assignment.copy()
+    for i in list(conflict):
+        lo[i], hi[i] = 0, 1
+        value = solve(lo,hi)[0]
+        LPs += 1
+        if value == np.inf:
+            conflict.remove(i)
+        else:
+            lo[i], hi[i] = assignment[i], assignment[i]
+
+    return np.array(conflict,dtype=int), LPs
+
+
+def BLP_bits(vector):
+
+    #Helper Function: Packs a 0-1 vector into an integer (first entry as the most significant bit)
+    #A nogood is stored as the pair (mask, value) of packed vectors, and an assignment contains it when assignment & mask == value
+
+    return int("".join("1" if v else "0" for v in vector),2) if len(vector) > 0 else 0
+
+
+def BLP_batch_LP(model,assignments,tol=1e-8,max_iter=80,rays=None,solve=None):
+
+    #Helper Function: Solves the compiled linear program for a whole block of fixed 0-1 assignments at once
+    #With the binaries fixed, they only shift the right-hand sides, so every linear program of the block shares the same dense matrices:
+    #min c @ v s.t. G @ v <= h_k, E @ v == e_k over the continuous variables v = [x, y, u] (the bound u >= 0 becomes rows of G)
+    #These are solved together by a primal-dual interior point method (Mehrotra predictor-corrector) on stacked numpy arrays,
+    #where each Newton step is one batched solve of the reduced KKT systems
+    #Instances are stopped as soon as they are solved to tolerance, or certified infeasible or unbounded by a Farkas ray
+    #The few that are still undecided after max_iter iterations are handed to solve (a solver of BLP_warm_LP), or to solve_compiled_LP
+    #A Farkas ray does not depend on the right-hand sides, so a ray found for one assignment also certifies every other assignment
+    #whose h_k @ z + e_k @ nu is negative enough; rays is an optional dictionary of such certificates ("z", "nu" and "bound",
+    #the most that h_k @ z + e_k @ nu may be), kept by the caller across blocks
+    #Instances it certifies are never handed to the interior point method, and the rays of newly certified instances are added to it
+    #Returns: optimal values (inf if infeasible, -inf if unbounded), the solutions v (nan unless solved), number of fallback solves
+
+    assignments = np.atleast_2d(np.asarray(assignments,dtype=float))
+    K = len(assignments)
+    N = len(model["c"])
+    binaries = np.zeros(N,dtype=bool)
+    binaries[model["binaries"]] = True
+    cols = np.flatnonzero(~binaries)
+
+    #Shared data; finite bounds of the continuous variables become extra inequality rows
+    I = np.identity(N)[cols]
+    has_lower = np.isfinite(model["lower"][cols])
+    has_upper = np.isfinite(model["upper"][cols])
+    G_full = np.vstack((model["A_ub"].toarray(),-I[has_lower],I[has_upper]))
+    h0 = np.concatenate((model["b_ub"],-model["lower"][cols][has_lower],model["upper"][cols][has_upper]))
+    G, G_bin = G_full[:,cols], G_full[:,binaries]
+    E_full = model["A_eq"].toarray()
+    E, E_bin = E_full[:,cols], E_full[:,binaries]
+    c = model["c"][cols]
+    mi, me, nv = len(h0), len(E), len(cols)
+
+    #Per-instance right-hand sides
+    h = h0 - assignments @ G_bin.T
+    e = model["b_eq"] - assignments @ E_bin.T
+    offset = assignments @ model["c"][binaries] + model["c0"]
+
+    #Starting point (as in CVXOPT): the least-squares primal slacks w = h - G @ v with E @ v == e, and the least-norm dual z
+    #with G^T z + E^T nu + c == 0, both shifted to be positive; the two share one small KKT matrix
+    KKT = np.block([[G.T @ G + 1e-12*np.identity(nv),E.T],[E,-1e-12*np.identity(me)]])
+    sol = np.linalg.solve(KKT,np.concatenate((h @ G,e),axis=1).T).T
+    v = sol[:,:nv]
+    w = h - v @ G.T
+    sol = np.linalg.solve(KKT,np.concatenate((-c,np.zeros(me))))
+    z = np.tile(G @ sol[:nv],(K,1))
+    nu = np.tile(sol[nv:],(K,1))
+    w += np.maximum(0,-w.min(axis=1,initial=0))[:,None] + 1
+    z += np.maximum(0,-z.min(axis=1,initial=0))[:,None] + 1
+    values = np.full(K,np.nan)
+    active = np.ones(K,dtype=bool)
+    if rays is not None and "z" in rays:
+        #A ray only counts when the sum stays negative beyond its rounding error (tol relative to the sum of absolute terms)
+        margin = tol*(np.abs(h) @ np.abs(rays["z"]).T + np.abs(e) @ np.abs(rays["nu"]).T)
+        screened = np.any(h @ rays["z"].T + e @ rays["nu"].T < np.minimum(rays["bound"],-margin),axis=1)
+        values[screened] = np.inf
+        active[screened] = False
+    scale_h = 1 + np.linalg.norm(h,axis=1)
+    scale_c = 1 + np.linalg.norm(c)
+
+    def newton(D,r_d,r_p,r_e,r_c,w,z):
+        #Eliminates dw and dz, and solves [G^T D G, E^T; E, 0] [dv, dnu] = rhs for every instance at once
+        #A small regularization keeps the systems nonsingular when D has very small or very large entries
+        H = (G.T*D[:,None,:]) @ G
+        delta = 1e-13*(1 + np.abs(H).max(axis=(1,2)))[:,None,None]
+        KKT = np.zeros((len(D),nv+me,nv+me))
+        KKT[:,:nv,:nv] = H + delta*np.identity(nv)
+        KKT[:,:nv,nv:] = E.T
+        KKT[:,nv:,:nv] = E
+        KKT[:,nv:,nv:] = -1e-13*np.identity(me)
+        rhs = np.concatenate((-r_d - (D*r_p + r_c/w) @ G,-r_e),axis=1)
+        try:
+            sol = np.linalg.solve(KKT,rhs[:,:,None])[:,:,0]
+        except np.linalg.LinAlgError:
+            sol = np.array([np.linalg.lstsq(M,r,rcond=None)[0] for M, r in zip(KKT,rhs)])
+        dv, dnu = sol[:,:nv], sol[:,nv:]
+        dz = D*(dv @ G.T + r_p) + r_c/w
+        dw = (r_c - w*dz)/z
+        return dv, dw, dz, dnu
+
+    def max_step(x,dx):
+        ratio = np.where(dx < 0,-x/np.where(dx < 0,dx,-1),np.inf)
+        return np.minimum(1,ratio.min(axis=1,initial=np.inf))
+
+    for it in range(max_iter):
+        idx = np.flatnonzero(active)
+        if len(idx) == 0:
+            break
+        va, wa, za, nua, ha, ea = v[idx], w[idx], z[idx], nu[idx], h[idx], e[idx]
+        r_d = c + za @ G + nua @ E
+        r_p = va @ G.T + wa - ha
+        r_e = va @ E.T - ea
+        mu = np.sum(wa*za,axis=1)/max(mi,1)
+        primal = va @ c
+        dual = -np.sum(ha*za,axis=1) - np.sum(ea*nua,axis=1)
+
+        #Solved to tolerance
+        done = ((np.linalg.norm(r_p,axis=1) + np.linalg.norm(r_e,axis=1))/scale_h[idx] < tol) & \
+               (np.linalg.norm(r_d,axis=1)/scale_c < tol) & (np.abs(primal-dual)/(1+np.abs(primal)) < tol)
+        values[idx[done]] = primal[done] + offset[idx[done]]
+
+        #Farkas certificate of primal infeasibility: z >= 0 with G^T z + E^T nu ~ 0 and h @ z + e @ nu < 0
+        ray = np.sum(ha*za,axis=1) + np.sum(ea*nua,axis=1)
+        residual = np.linalg.norm(za @ G + nua @ E,axis=1)
+        infeasible = ~done & (ray < 0) & (residual < 1e-7*np.abs(ray))
+        values[idx[infeasible]] = np.inf
+        if rays is not None and infeasible.any():
+            #Diverging duals make these sums lose all precision, so the rays are normalized and tested again before they are pooled
+            #The same test for another assignment then reads h_k @ z + e_k @ nu < -residual/1e-7
+            scale = np.maximum(np.abs(za[infeasible]).max(axis=1),np.abs(nua[infeasible]).max(axis=1,initial=0))[:,None]
+            z_ray, nu_ray = za[infeasible]/scale, nua[infeasible]/scale
+            bound = -np.linalg.norm(z_ray @ G + nu_ray @ E,axis=1)/1e-7
+            margin = tol*(np.sum(np.abs(ha[infeasible]*z_ray),axis=1) + np.sum(np.abs(ea[infeasible]*nu_ray),axis=1))
+            sound = np.sum(ha[infeasible]*z_ray,axis=1) + np.sum(ea[infeasible]*nu_ray,axis=1) < np.minimum(bound,-margin)
+            for key, new in [("z",z_ray[sound]),("nu",nu_ray[sound]),("bound",bound[sound])]:
+                rays[key] = np.concatenate((rays[key],new)) if key in rays else new
+
+        #Unbounded direction: G d <= 0, E d ~ 0 with c @ d < 0, read off the normalized iterate
+        unbounded = ~done & ~infeasible & (primal < 0) & \
+                    (np.max(np.maximum(va @ G.T,0),axis=1,initial=0) + np.linalg.norm(va @ E.T,axis=1) < 1e-7*np.abs(primal))
+        values[idx[unbounded]] = -np.inf
+
+        stop = done | infeasible | unbounded
+        active[idx[stop]] = False
+        keep = ~stop
+        if not keep.any():
+            break
+        idx, va, wa, za, nua = idx[keep], va[keep], wa[keep], za[keep], nua[keep]
+        r_d, r_p, r_e, mu = r_d[keep], r_p[keep], r_e[keep], mu[keep]
+
+        #Predictor (affine scaling) step, then the centering-corrector step
+        D = za/wa
+        dv, dw, dz, dnu = newton(D,r_d,r_p,r_e,-wa*za,wa,za)
+        alpha = np.minimum(max_step(wa,dw),max_step(za,dz))[:,None]
+        mu_aff = np.sum((wa+alpha*dw)*(za+alpha*dz),axis=1)/max(mi,1)
+        sigma = (mu_aff/mu)**3
+        dv, dw, dz, dnu = newton(D,r_d,r_p,r_e,-wa*za - dw*dz + (sigma*mu)[:,None],wa,za)
+        alpha = 0.99*np.minimum(max_step(wa,dw),max_step(za,dz))[:,None]
+
+        v[idx] = va + alpha*dv
+        w[idx] = wa + alpha*dw
+        z[idx] = za + alpha*dz
+        nu[idx] = nua + alpha*dnu
+
+    #Undecided instances go to the simplex solver
+    V = np.full((K,N),np.nan)
+    V[:,cols] = v
+    V[:,binaries] = assignments
+    undecided = np.flatnonzero(np.isnan(values))
+    for k in undecided:
+        if solve is None:
+            values[k], xVal, yVal, uVal = solve_compiled_LP(model,assignments[k],assignments[k])
+        else:
+            values[k], xVal, yVal, uVal, _ = solve(assignments[k],assignments[k])
+        if xVal is not None:
+            V[k,model["x"]], V[k,model["y"]], V[k,model["u"]] = xVal, yVal, uVal
+    V[~np.isfinite(values)] = np.nan
+    return values, V, len(undecided)
+
+
+def solve_BLP(upper_objective=[],lower_objective=[],upper_ineq=[],upper_eq=[],lower_ineq=[],lower_eq=[],spec=None,method="enumerate",M=100,tighten_M=False,workers=None,warm_start=True,learn_nogoods=True,time_limit=None,checkpoint_path=None,checkpoint_every=60,resume_from=None,presolve=False,gap=1e-6,return_info=False):
+
+    #Primary function: Solves the Linear Bilevel Program using a naive Mixed Integer Linear Programming Implementation
+    #Integer variables are constrained to binary vectors, so we simply solve the corresponding linear program for each possible assignment
+    #We take the most optimal value at the end, and return:
+        #1) A list of the most optimal upper-level objective function values after each time a linear program is run
+        #2) A list of the corresponding iterates for each of the optimal upper-level objective function values
+        #3) The current runtime of the function after each linear program is run
+    #method selects how the 0-1 variables are searched:
+        #"enumerate": solve the linear program for every 0-1 assignment
+        #"naive": same enumeration, but rebuilding the cvx problem for every assignment (slow, kept as a reference)
+        #"branch_and_bound": branch on the complementarity binaries, pruning nodes with their LP relaxation
+        #"lazy": branch-and-bound on the KKT system without big-M constraints, branching only on violated complementarity pairs
+        #"milp": hand the whole reformulation, with zeta and eta as binary variables, to the HiGHS MILP solver
+        #"batch": enumeration in blocks of assignments, each block solved at once by a batched interior point method in numpy
+        #"parallel": enumeration split into chunks over a pool of worker processes (workers defaults to the number of CPUs)
+        #"strong_duality": spatial branch-and-bound on the strong duality reformulation, with no 0-1 variables at all
+        #(x must be bounded; the duals are boxed by the big-Ms of u from BLP_big_M, and the result is optimal up to the relative gap,
+        #see BLP_strong_duality)
+        #"kth_best": visit the vertices of the constraint polyhedron by increasing upper-level objective until one is lower-level rational
+        #(the upper level constraints must not involve y, see BLP_kth_best)
+    #Instead of the nested lists, the problem can be given as a compact specification with sparse matrices (see BLP_spec)
+    #If tighten_M is True, every 0-1 constraint gets its own big-M from bound-tightening linear programs (BLP_big_M);
+    #M is then only used where those linear programs are unbounded
+    #With warm_start, consecutive linear programs differ by a single binary where possible and start from the previous optimal basis
+    #(see BLP_warm_LP); the simplex iterations of each linear program are recorded in its LP_solutions entry under "iterations"
+    #With learn_nogoods, the enumeration methods learn a minimal infeasible subset of binaries from every infeasible linear program
+    #and skip all later assignments containing one (see BLP_conflict); info then counts the skipped assignments and the conflict analysis cost
+    #With a time_limit (in seconds), the search stops once it is used up; the best point found so far is then not proven optimal
+    #With a checkpoint_path, the state of the enumerate, branch_and_bound, lazy and batch searches (cursor or open nodes, incumbent, nogoods)
+    #is saved there every checkpoint_every seconds and when the search stops; resume_from continues the search from such a file,
+    #and the resumed LP_solutions start with the incumbent found before (times continue from the earlier run)
+    #With presolve, fixed variables and redundant constraints are removed before the search (see BLP_presolve); the search then has fewer
+    #binaries, its entries are mapped back to the original variables and info["presolve"] reports what was removed
+    #(lower level sign rows stay in the lower level for kth_best and strong_duality, whose lower level has free y)
+    #Every LP_solutions entry carries a "profile" of its phase timings and solver status, and info["profile"] sums them up per phase
+    #(see BLP_profile), so that it shows where the time goes: building, canonicalization, the solver itself or reading the solution back
+    #If return_info is True, a dictionary of search statistics is returned alongside LP_solutions
+    #("finished" tells whether the search completed within the time limit; for the milp method, whether HiGHS solved the model to optimality,
+    #with its outcome under "status")
+
+    start_time = time.time()
+
+    #Assemble the problem into a compact specification with sparse constraint matrices (unless one is given as spec)
+    if spec is None:
+        spec = BLP_spec(upper_objective=upper_objective,lower_objective=lower_objective,upper_ineq=upper_ineq,upper_eq=upper_eq,
+                        lower_ineq=lower_ineq,lower_eq=lower_eq)
+    deadline = np.inf if time_limit is None else start_time + time_limit
+    if presolve:
+        spec, presolved = BLP_presolve(spec,move_sign_rows=method not in ["kth_best","strong_duality"])
+
+    state = {}
+    if resume_from is not None:
+        state, elapsed = BLP_load_checkpoint(resume_from,method)
+        start_time -= elapsed
+    checkpoint = None if checkpoint_path is None else {"path": checkpoint_path, "every": checkpoint_every}
+
+    #Collect the entry of every linear program solved by the search (see solve_BLP_anytime to only keep the incumbents)
+    info = {}
+    search_time = time.time()
+    LP_solutions = list(BLP_search(spec,method,M,tighten_M,workers,warm_start,learn_nogoods,start_time,deadline,info,state,checkpoint,gap))
+    if presolve:
+        LP_solutions = BLP_postsolve(presolved,LP_solutions)
+        info["presolve"] = presolved["report"]
+    info.setdefault("nodes",sum(1 for sol in LP_solutions if not sol.get("resumed")))
+    iterations = [sol["iterations"] for sol in LP_solutions if sol.get("iterations") is not None]
+    if iterations:
+        info["simplex_iterations"] = int(np.sum(iterations))
+    if method in ["enumerate","parallel"] and learn_nogoods:
+        info["conflict_LPs"] = int(np.sum([sol.get("conflict_LPs",0) for sol in LP_solutions]))
+        if method == "enumerate" and info["finished"] and resume_from is None:
+            info["nogood_skipped"] = info["full_enumeration"] - info["nodes"]
+    if method == "parallel":
+        #Workers report chunk by chunk; order the entries by the time they were solved
+        LP_solutions.sort(key=lambda sol: sol["time"])
+    info["profile"] = BLP_profile(LP_solutions,time.time()-search_time)
+
+    if return_info:
+        return LP_solutions, info
+    return LP_solutions
+
+
+def solve_BLP_anytime(upper_objective=[],lower_objective=[],upper_ineq=[],upper_eq=[],lower_ineq=[],lower_eq=[],spec=None,method="branch_and_bound",M=100,tighten_M=False,workers=None,warm_start=True,learn_nogoods=True,time_limit=None,max_LPs=None,presolve=False,gap=1e-6):
+
+    #Primary function: Anytime version of solve_BLP, written as a generator
+    #Takes the same problem description and options as solve_BLP, but instead of returning the entry of every linear program,
+    #it yields each improved incumbent as soon as it is found, as a dictionary with "value", "x", "y", "u",
+    #"time" (seconds since the start) and "LPs" (number of linear programs solved so far)
+    #The search stops when it is done, when time_limit seconds have passed or when max_LPs linear programs have been solved,
+    #so the last incumbent yielded is the best point found within the budget
+    #Only the current incumbent is kept; the generator's return value is the statistics dictionary of solve_BLP(return_info=True)
+    #Breaking out of the loop early also stops the search
+    #(with the parallel method, max_LPs is checked as the workers' chunks come in, so a few more linear programs may be solved;
+    #assignments skipped by nogood learning are not counted, so on large enumerations a time_limit is the safer budget)
+
+    start_time = time.time()
+    if spec is None:
+        spec = BLP_spec(upper_objective=upper_objective,lower_objective=lower_objective,upper_ineq=upper_ineq,upper_eq=upper_eq,
+                        lower_ineq=lower_ineq,lower_eq=lower_eq)
+    deadline = np.inf if time_limit is None else start_time + time_limit
+    if presolve:
+        spec, presolved = BLP_presolve(spec,move_sign_rows=method not in ["kth_best","strong_duality"])
+
+    info = {}
+    incumbent = np.inf
+    LPs = 0
+    search = BLP_search(spec,method,M,tighten_M,workers,warm_start,learn_nogoods,start_time,deadline,info,gap=gap)
+    try:
+        for LPs, sol in enumerate(search,start=1):
+            if sol["value"] is not None and sol["value"] < incumbent:
+                incumbent = sol["value"]
+                if presolve:
+                    sol = BLP_postsolve(presolved,[sol])[0]
+                yield {"value": sol["value"], "x": sol["x"], "y": sol["y"], "u": sol["u"], "time": sol["time"], "LPs": LPs}
+            if max_LPs is not None and LPs >= max_LPs:
+                break
+    finally:
+        search.close()
+
+    info["LPs"] = LPs
+    if presolve:
+        info["presolve"] = presolved["report"]
+    info.setdefault("nodes",info["LPs"])
+    return info
+
+
+def BLP_search(spec,method,M,tighten_M,workers,warm_start,learn_nogoods,start_time,deadline,info,state=None,checkpoint=None,gap=1e-6):
+
+    #Helper Function: Runs the chosen search method on a problem specification, as a generator
+    #Every linear program's LP_solutions entry is yielded as soon as it is solved, so nothing is kept here;
+    #closing the generator early stops the search (and shuts down the worker pool of the parallel method)
+    #The search statistics (method, size of the full enumeration, big-M details, and whether the search finished) are written into info
+    #state holds the search state loaded from a checkpoint to resume from (see BLP_load_checkpoint), and checkpoint, if given,
+    #is a dictionary with the "path" and the interval "every" (in seconds) of periodic checkpoints (see BLP_checkpointed)
+    #gap is the relative optimality gap of the strong_duality method
+
+    #Check sizes to ensure the problem is well-defined
+    n,m,p1,p2,q1,q2 = size_compatibility(spec)
+    state = {} if state is None else state
+    if (checkpoint is not None or state) and method not in ["enumerate","branch_and_bound","lazy","batch"]:
+        raise Exception(f"Error: Checkpoints are only supported for the enumerate, branch_and_bound, lazy and batch methods, not {method}")
+
+    #Constraint matrices of the MILP KKT reformulation of the BLO problem
+    #Inequality constraints come first, followed by the equality constraints
+    #Lower level equality constraints need no complementarity, only a free dual variable, so they get no 0-1 variables
+    A, B, C, D, s, t = spec["A"], spec["B"], spec["C"], spec["D"], spec["s"], spec["t"]
+    upper_objective, lower_objective = spec["upper_objective"], spec["lower_objective"]
+
+    #M is the big-M constant of the 0-1 constraints: a large positive constant, ideally much larger than the constants in the problem description.
+    #M=100 worked for our case
+    info.update({"method": method, "full_enumeration": 2**(m+q1), "finished": False})
+    M_constant = M
+    if tighten_M:
+        M, info["big_M_fallback"] = BLP_big_M(A,B,C,D,s,t,lower_objective,M,p2,q2)
+        info["big_M"] = M
+
+    if method == "naive":
+        #Reference implementation: builds and solves a fresh cvx problem for every 0-1 assignment
+        #Initialize upper variable x, lower variable y, dual variable u and the upper-level objective
+        x = cvx.Variable(n)
+        y = cvx.Variable(m)
+        u = cvx.Variable(q1+q2)
+        objective_expression = upper_objective[0].T @ x + upper_objective[1].T @ y + upper_objective[2]
+        constraints = []
+
+        #Add the upper and lower level constraints
+        constraints.append(A[:p1] @ x + B[:p1] @ y <= s[:p1])
+        constraints.append(C[:q1] @ x + D[:q1] @ y <= t[:q1])
+        if p2 > 0:
+            constraints.append(A[p1:] @ x + B[p1:] @ y == s[p1:])
+        if q2 > 0:
+            constraints.append(C[q1:] @ x + D[q1:] @ y == t[q1:])
+
+        #Constraints of the dual variable imposed by the KKT conditions of the lower problem
+        #Duals of the lower level equality constraints (the last q2 entries of u) are free
+        constraints.append(u.T @ D >= -lower_objective[1].T)
+        constraints.append(u[:q1] >= 0)
+
+        info["finished"] = yield from BLP_naive_enumerate(x,y,u,A,B,C,D,s,t,lower_objective,M,q1,objective_expression,constraints,start_time,deadline)
+    elif method == "kth_best":
+        #Works on the vertices of the constraint polyhedron, without the KKT reformulation (M is not used)
+        info["finished"] = yield from BLP_kth_best(spec,start_time,deadline)
+    elif method == "strong_duality":
+        #Spatial branch-and-bound without 0-1 variables; the big-Ms of u bound the dual variables of the McCormick envelopes
+        #They are derived by bound tightening even without tighten_M, since the constant M makes the envelopes loose
+        #(duals of lower level constraints without y then get the box [0, 0]; unbounded entries keep M)
+        if not tighten_M:
+            M, info["big_M_fallback"] = BLP_big_M(A,B,C,D,s,t,lower_objective,M_constant,p2,q2)
+        info["finished"] = yield from BLP_strong_duality(spec,M["u"],M_constant,start_time,deadline,gap)
+    elif method == "lazy":
+        #Branch-and-bound on the relaxed KKT system, restoring only the complementarity pairs it finds violated (M is not used)
+        model = BLP_compile_lazy(A,B,C,D,s,t,upper_objective,lower_objective,p2,q2)
+        search = BLP_branch_and_bound(model,start_time,deadline,warm_start,state=state)
+        if checkpoint is not None or state:
+            search = BLP_checkpointed(search,method,state,checkpoint,start_time)
+        info["finished"] = yield from search
+    else:
+        #Compile the KKT reformulation once; every linear program below only changes the bounds of the 0-1 variables
+        model = BLP_compile(A,B,C,D,s,t,upper_objective,lower_objective,M,p2,q2)
+        if method in ["branch_and_bound","enumerate","batch"]:
+            if method == "branch_and_bound":
+                search = BLP_branch_and_bound(model,start_time,deadline,warm_start,state=state)
+            elif method == "enumerate":
+                search = BLP_enumerate(model,start_time,deadline,warm_start,learn_nogoods,state=state)
+            else:
+                search = BLP_batch_enumerate(model,start_time,deadline,state=state)
+            if checkpoint is not None or state:
+                search = BLP_checkpointed(search,method,state,checkpoint,start_time)
+            info["finished"] = yield from search
+        elif method == "milp":
+            LP_solutions, info["nodes"], info["finished"] = BLP_milp(model,start_time,deadline)
+            info["status"] = LP_solutions[0]["profile"]["status"]
+            yield from LP_solutions
+        elif method == "parallel":
+            info["finished"] = yield from BLP_parallel_enumerate(model,start_time,workers,deadline,warm_start,learn_nogoods)
+        else:
+            raise Exception(f"Error: Unknown method {method}")
+
+
+def BLP_checkpointed(search,method,state,checkpoint,start_time):
+
+    #Helper Function: Passes the LP_solutions entries of a search generator through, keeping the incumbent in its state dictionary
+    #If checkpoint is given, the state is written to checkpoint["path"] every checkpoint["every"] seconds,
+    #and once more when the search ends, runs out of time, fails or is closed early
+    #When resuming, the incumbent of the checkpoint is yielded first (marked "resumed"), so that the trace of the resumed run starts from it
+    #This is a generator returning whether the search finished
+
+    state.setdefault("incumbent",{"value": np.inf, "x": None, "y": None, "u": None, "time": 0.0})
+    if state["incumbent"]["value"] < np.inf:
+        yield dict(state["incumbent"],resumed=True)
+
+    finished = False
+    last_checkpoint = time.time()
+    try:
+        while True:
+            try:
+                sol = next(search)
+            except StopIteration as stop:
+                finished = stop.value
+                break
+            if sol["value"] is not None and sol["value"] < state["incumbent"]["value"]:
+                state["incumbent"] = {"value": sol["value"], "x": sol["x"], "y": sol["y"], "u": sol["u"], "time": sol["time"]}
+            yield sol
+            if checkpoint is not None and time.time() - last_checkpoint > checkpoint["every"]:
+                BLP_save_checkpoint(checkpoint["path"],method,state,time.time()-start_time)
+                last_checkpoint = time.time()
+    finally:
+        if checkpoint is not None:
+            BLP_save_checkpoint(checkpoint["path"],method,state,time.time()-start_time)
+    return finished
+
+
+def BLP_save_checkpoint(path,method,state,elapsed):
+
+    #Helper Function: Writes the search state to a compressed numpy file: the method, the time spent so far, the incumbent,
+    #the enumeration cursor and order, the nogoods (as decimal strings of their packed masks and values) and the open tree nodes
+    #The file is written next to path first and then moved into place, so an interrupted write never destroys the previous checkpoint
+
+    incumbent = state["incumbent"]
+    nogoods = state.get("nogoods",[])
+    stack = state.get("stack",[])
+    arrays = {"method": method, "elapsed": elapsed, "binaries": state.get("binaries",0),
+              "cursor": state.get("cursor",0), "order": state.get("order",""),
+              "incumbent_value": incumbent["value"], "incumbent_time": incumbent["time"],
+              "nogood_masks": np.array([str(mask) for mask, nogood in nogoods],dtype=str),
+              "nogood_values": np.array([str(nogood) for mask, nogood in nogoods],dtype=str),
+              "stack_lo": np.array([lo for lo, hi in stack],dtype=np.int8),
+              "stack_hi": np.array([hi for lo, hi in stack],dtype=np.int8)}
+    for key in ["x","y","u"]:
+        arrays["incumbent_"+key] = np.zeros(0) if incumbent[key] is None else incumbent[key]
+
+    with open(path + ".tmp","wb") as f:
+        np.savez_compressed(f,**arrays)
+    os.replace(path + ".tmp",path)
+
+
+def BLP_load_checkpoint(path,method):
+
+    #Helper Function: Reads a checkpoint written by BLP_save_checkpoint for the given method
+    #Returns: the state dictionary to resume the search from (see BLP_search), the time spent before the checkpoint
+
+    with np.load(path) as data:
+        if str(data["method"]) != method:
+            raise Exception(f"Error: Checkpoint {path} was written by method {data['method']}, not {method}")
+        incumbent = {"value": float(data["incumbent_value"]), "time": float(data["incumbent_time"])}
+        for key in ["x","y","u"]:
+            incumbent[key] = data["incumbent_"+key] if np.isfinite(incumbent["value"]) else None
+        state = {"binaries": int(data["binaries"]), "incumbent": incumbent}
+        if method in ["enumerate","batch"]:
+            state["cursor"] = int(data["cursor"])
+        if method == "enumerate":
+            state["order"] = str(data["order"])
+            state["nogoods"] = [(int(mask),int(nogood)) for mask, nogood in zip(data["nogood_masks"],data["nogood_values"])]
+        if method in ["branch_and_bound","lazy"]:
+            state["stack"] = [(lo.astype(float),hi.astype(float)) for lo, hi in zip(data["stack_lo"],data["stack_hi"])]
+        return state, float(data["elapsed"])
+
+
+def BLP_enumerate(model,start_time,deadline=np.inf,warm_start=True,learn_nogoods=True,state=None):
+
+    #Helper Function: Iterates over all 0-1 integer inputs of the compiled model, solving one linear program per assignment
+    #With warm_start, assignments are visited in Gray code order and each linear program starts from the previous optimal basis,
+    #so consecutive solves differ by a single flipped binary; otherwise they are visited in lexicographic order and solved from scratch
+    #With learn_nogoods, every infeasible assignment goes through conflict analysis (BLP_conflict), and the minimal infeasible subset
+    #of its binaries is stored as a nogood; later assignments containing a stored nogood are skipped without solving (and not yielded)
+    #The linear programs spent on conflict analysis are recorded under "conflict_LPs" in the entry of the infeasible assignment
+    #Each entry's "profile" holds the phase timings and status of its linear program (see BLP_profile), with conflict analysis as "conflict"
+    #The position in the enumeration order ("cursor") and the nogoods are kept in the state dictionary, which can be checkpointed;
+    #a state loaded from a checkpoint continues the enumeration where it stopped
+    #Stops early once time.time() passes deadline
+    #This is a generator: it yields one LP_solutions entry per linear program as soon as it is solved,
+    #and returns whether every assignment was solved
+
+    m = model["m"]
+    q = model["q"]
+
+    solve = BLP_warm_LP(model,warm_start)
+    elastic = BLP_elastic(model) if learn_nogoods else None
+    state = {} if state is None else state
+    order = "gray" if warm_start else "lexicographic"
+    if state.setdefault("binaries",m+q) != m+q or state.setdefault("order",order) != order:
+        raise Exception("Error: Checkpoint does not match the problem size or the enumeration order (warm_start)")
+    state.setdefault("cursor",0)
+    nogoods = state.setdefault("nogoods",[])
+
+    #zeta varies slowest, then eta
+    if warm_start:
+        assignments = BLP_gray_code(m+q,state["cursor"])
+    else:
+        assignments = itertools.islice(itertools.product([0,1],repeat=m+q),state["cursor"],None)
+    for assignment in assignments:
+        if time.time() > deadline:
+            return False
+        state["cursor"] += 1
+
+        #Fix the 0-1 variables through their bounds and solve the linear program!
+        assignment = np.array(assignment)
+        bits = BLP_bits(assignment)
+        if any(bits & mask == nogood for mask, nogood in nogoods):
+            continue
+        profile = {}
+        value, xVal, yVal, uVal, iterations = solve(assignment,assignment,profile)
+
+        conflict_LPs = 0
+        if learn_nogoods and value == np.inf:
+            tic = time.perf_counter()
+            conflict, conflict_LPs = BLP_conflict(model,elastic,assignment,solve)
+            if conflict is not None:
+                in_conflict = np.isin(np.arange(m+q),conflict)
+                nogoods.append((BLP_bits(in_conflict),BLP_bits(assignment*in_conflict)))
+            profile["conflict"] = time.perf_counter() - tic
+        end_time = time.time()
+
+        yield {"value": value, "x": xVal, "y": yVal, "u": uVal, "time": end_time-start_time, "iterations": iterations, "conflict_LPs": conflict_LPs,
+               "profile": profile}
+    return True
+
+
+def BLP_gray_code(N,start=0):
+
+    #Helper Function: Iterates over all 0-1 vectors of length N in reflected Gray code order, so consecutive vectors differ in exactly one entry
+    #As in itertools.product, the last entry changes most often and the first entry least often
+    #The sequence can be started at its entry number start (to resume an enumeration)
+    #This is a generator yielding one numpy array per vector
+
+    if start >= 2**N:
+        return
+    gray = start ^ (start >> 1)
+    assignment = np.array([(gray >> (N-1-j)) & 1 for j in range(N)],dtype=float)
+    yield assignment.copy()
+    for i in range(start+1,2**N):
+        #The entry to flip is given by the number of trailing zeros of i
+        k = (i & -i).bit_length() - 1
+        assignment[N-1-k] = 1 - assignment[N-1-k]
+        yield assignment.copy()
+
+
+def BLP_batch_enumerate(model,start_time,deadline=np.inf,state=None,batch_size=256):
+
+    #Helper Function: Iterates over all 0-1 integer inputs of the compiled model in blocks of assignments,
+    #solving each block's linear programs together with the batched interior point method (BLP_batch_LP)
+    #Most fixed assignments are infeasible, and the Farkas rays that certify them are pooled across blocks, so that later blocks
+    #hand only the assignments no earlier ray rules out to the interior point method
+    #Blocks therefore start small (64 assignments) to fill the pool early, and double up to batch_size; larger blocks mostly
+    #add interior point iterations on instances that a ray of the same block would have screened out
+    #Linear programs left undecided by the interior point method are solved by one HiGHS instance kept for the search (BLP_warm_LP)
+    #The number of assignments done ("cursor") is kept in the state dictionary, which can be checkpointed; it only moves on
+    #once all entries of a block have been yielded, so a checkpoint taken in the middle of a block repeats that block on resume
+    #The time of a block is shared evenly among its linear programs in their "profile" ("solve"), which also tells how many
+    #linear programs of the block went to the simplex fallback ("fallback"; see BLP_profile)
+    #Stops early (between blocks) once time.time() passes deadline
+    #This is a generator: it yields one LP_solutions entry per linear program, in lexicographic order, as soon as its block is solved,
+    #and returns whether every assignment was solved
+
+    state = {} if state is None else state
+    if state.setdefault("binaries",model["m"]+model["q"]) != model["m"]+model["q"]:
+        raise Exception("Error: Checkpoint does not match the problem size")
+    state.setdefault("cursor",0)
+
+    assignments = itertools.islice(itertools.product([0,1],repeat=model["m"]+model["q"]),state["cursor"],None)
+    rays = {}
+    solve = BLP_warm_LP(model)
+    size = min(64,batch_size)
+    while True:
+        block = np.array(list(itertools.islice(assignments,size)))
+        if len(block) == 0:
+            return True
+        if time.time() > deadline:
+            return False
+
+        tic = time.perf_counter()
+        values, V, fallback = BLP_batch_LP(model,block,rays=rays,solve=solve)
+        size = min(2*size,batch_size)
+        share = (time.perf_counter() - tic)/len(block)
+        end_time = time.time()
+        for value, v in zip(values,V):
+            solved = np.isfinite(value)
+            status = "optimal" if solved else ("unbounded" if value == -np.inf else "infeasible")
+            yield {"value": value, "x": v[model["x"]] if solved else None, "y": v[model["y"]] if solved else None,
+                   "u": v[model["u"]] if solved else None, "time": end_time-start_time,
+                   "profile": {"solve": share, "status": status, "fallback": fallback}}
+        state["cursor"] += len(block)
+
+
+def BLP_naive_enumerate(x,y,u,A,B,C,D,s,t,lower_obj,M,q,objective_expression,constraints,start_time,deadline=np.inf):
+
+    #Helper Function: Naively iterates over all 0-1 integer inputs, building and solving one cvx problem per assignment
+    #Only the first q (inequality) rows of C, D, t get a 0-1 variable eta
+    #Each entry's "profile" splits its time into building the constraints in Python ("build"), cvx canonicalization ("canonicalize"),
+    #the solver itself ("solve") and the rest of prob.solve, mostly unpacking the solution ("extract"), with the cvx status (see BLP_profile)
+    #Stops early once time.time() passes deadline
+    #This is a generator: it yields one LP_solutions entry per linear program, and returns whether every assignment was solved
+
+    m = np.shape(D)[1]
+
+    for zeta in itertools.product([0, 1], repeat=m):
+        for eta in itertools.product([0,1],repeat=q):
+            if time.time() > deadline:
+                return False
+
+            #Add the constraints due to the 0-1 variables
+            tic = time.perf_counter()
+            mixed_constraints = BLP_Int_Constraints(x,y,u,A,B,C,D,s,t,lower_obj,M,zeta,eta)
+
+            #Combine all constraints into one list
+            all_constraints = []
+            for cnstr in constraints:
+                all_constraints.append(cnstr)
+            for cnstr in mixed_constraints:
+                all_constraints.append(cnstr)
+
+            #Solve the linear program!
+            toc = time.perf_counter()
+            prob, xVal, yVal, uVal = solve_LP(x,y,u,objective_expression,all_constraints)
+            end_time = time.time()
+            total = time.perf_counter() - toc
+            canonicalize = prob.compilation_time or 0
+            solve = prob.solver_stats.solve_time or 0
+            profile = {"build": toc - tic, "canonicalize": canonicalize, "solve": solve, "extract": max(total - canonicalize - solve,0),
+                       "status": prob.status}
+
+            yield {"value": prob.value, "x": xVal, "y": yVal, "u": uVal, "time": end_time-start_time, "profile": profile}
+    return True
+
+
+def BLP_parallel_enumerate(model,start_time,workers=None,deadline=np.inf,warm_start=True,learn_nogoods=True,chunk_bits=None):
+
+    #Helper Function: Enumerates all 0-1 integer inputs on a pool of worker processes
+    #The assignment space is split into chunks that share their first chunk_bits binaries (zeta first, then eta)
+    #Each worker first solves the LP relaxation of its chunk (prefix fixed, remaining binaries in [0,1]) as a bound for the whole chunk
+    #The best objective found so far is shared between the workers, and a chunk is abandoned as soon as its bound is no better
+    #With warm_start, each worker keeps one HiGHS instance and walks its chunks in Gray code order (see BLP_enumerate)
+    #With learn_nogoods, each worker keeps the nogoods it learns across its chunks and skips assignments containing them
+    #Workers stop once time.time() passes deadline
+    #This is a generator: it yields the LP_solutions entries of each chunk as soon as its worker is done with it
+    #(so entries are ordered by chunk, not by time), and returns whether every chunk was finished
+
+    N = model["m"] + model["q"]
+    if workers is None:
+        workers = os.cpu_count()
+    if chunk_bits is None:
+        #A few chunks per worker, so that a worker finishing early can pick up more work
+        chunk_bits = min(N, int(np.ceil(np.log2(4*workers))))
+
+    incumbent = multiprocessing.Value("d", np.inf)
+    with multiprocessing.Pool(workers,initializer=BLP_parallel_init,initargs=(model,start_time,incumbent,chunk_bits,deadline,warm_start,learn_nogoods)) as pool:
+        all_finished = True
+        for chunk, finished in pool.imap_unordered(BLP_parallel_chunk,range(2**chunk_bits),chunksize=1):
+            all_finished = all_finished and finished
+            yield from chunk
+    return all_finished
+
+
+def BLP_parallel_init(model,start_time,incumbent,chunk_bits,deadline,warm_start,learn_nogoods):
+
+    #Helper Function: Stores the compiled model and the shared incumbent in each worker process,
+    #together with the worker's own linear program solver (see BLP_warm_LP) and its list of learned nogoods (see BLP_enumerate)
+
+    global BLP_parallel_state
+    elastic = BLP_elastic(model) if learn_nogoods else None
+    BLP_parallel_state = (model,start_time,incumbent,chunk_bits,deadline,warm_start,BLP_warm_LP(model,warm_start),elastic,[])
+
+
+def BLP_parallel_chunk(chunk):
+
+    #Helper Function: Solves the linear programs of one chunk of 0-1 assignments inside a worker process
+    #Returns: the chunk's LP_solutions (the chunk relaxation is recorded with value inf, since it is only a bound),
+    #whether the chunk was finished (abandoning it for its bound counts as finished, running out of time does not)
+
+    model, start_time, incumbent, chunk_bits, deadline, warm_start, solve, elastic, nogoods = BLP_parallel_state
+    N = model["m"] + model["q"]
+
+    prefix = np.array([int(bit) for bit in np.binary_repr(chunk,width=chunk_bits)]) if chunk_bits > 0 else np.zeros(0)
+    lo = np.concatenate((prefix,np.zeros(N-chunk_bits)))
+    hi = np.concatenate((prefix,np.ones(N-chunk_bits)))
+
+    profile = {}
+    bound, xVal, yVal, uVal, iterations = solve(lo,hi,profile)
+    LP_solutions = [{"value": np.inf, "bound": bound, "x": xVal, "y": yVal, "u": uVal, "time": time.time()-start_time, "iterations": iterations,
+                     "profile": profile}]
+
+    for suffix in BLP_gray_code(N-chunk_bits) if warm_start else itertools.product([0,1],repeat=N-chunk_bits):
+        if time.time() > deadline:
+            return LP_solutions, False
+
+        #Abandon the chunk once another worker has found something at least as good as its relaxation
+        if bound >= incumbent.value:
+            break
+
+        assignment = np.concatenate((prefix,suffix))
+        bits = BLP_bits(assignment)
+        if any(bits & mask == nogood for mask, nogood in nogoods):
+            continue
+        profile = {}
+        value, xVal, yVal, uVal, iterations = solve(assignment,assignment,profile)
+
+        conflict_LPs = 0
+        if elastic is not None and value == np.inf:
+            tic = time.perf_counter()
+            conflict, conflict_LPs = BLP_conflict(model,elastic,assignment,solve)
+            if conflict is not None:
+                in_conflict = np.isin(np.arange(N),conflict)
+                nogoods.append((BLP_bits(in_conflict),BLP_bits(assignment*in_conflict)))
+            profile["conflict"] = time.perf_counter() - tic
+        LP_solutions.append({"value": value, "x": xVal, "y": yVal, "u": uVal, "time": time.time()-start_time, "iterations": iterations,
+                             "conflict_LPs": conflict_LPs, "profile": profile})
+
+        if value < incumbent.value:
+            with incumbent.get_lock():
+                incumbent.value = min(incumbent.value,value)
+
+    return LP_solutions, True
+
+
+def BLP_milp(model,start_time,deadline=np.inf):
+
+    #Helper Function: Solves the compiled KKT reformulation as one mixed-integer linear program, with zeta and eta declared binary
+    #HiGHS (through scipy.optimize.milp) then does its own presolve, cutting planes, heuristics and branching
+    #HiGHS is given the time left until deadline; if it runs out, its best feasible point (if any) is reported
+    #Only an optimal solve counts as finished; a time limit, an infeasible or unbounded model or a solver error does not
+    #(the entry's profile status tells them apart)
+    #Returns: LP_solutions (a single entry for the MILP solve), number of branch-and-bound nodes reported by HiGHS, whether HiGHS finished
+
+    integrality = np.zeros(len(model["c"]))
+    integrality[model["binaries"]] = 1
+
+    constraints = [LinearConstraint(model["A_ub"],-np.inf,model["b_ub"])]
+    if len(model["b_eq"]) > 0:
+        constraints.append(LinearConstraint(model["A_eq"],model["b_eq"],model["b_eq"]))
+
+    options = {} if deadline == np.inf else {"time_limit": max(deadline-time.time(),0)}
+    tic = time.perf_counter()
+    res = milp(model["c"],constraints=constraints,integrality=integrality,bounds=Bounds(model["lower"],model["upper"]),options=options)
+    end_time = time.time()
+    profile = {"solve": time.perf_counter() - tic,
+               "status": {0: "optimal", 1: "time_limit", 2: "infeasible", 3: "unbounded"}.get(res.status,"error")}
+
+    if res.x is not None:
+        v = res.x
+        solution = {"value": res.fun + model["c0"], "x": v[model["x"]], "y": v[model["y"]], "u": v[model["u"]], "time": end_time-start_time,
+                    "profile": profile}
+    else:
+        value = -np.inf if res.status == 3 else np.inf
+        solution = {"value": value, "x": None, "y": None, "u": None, "time": end_time-start_time, "profile": profile}
+    #HiGHS reports no node count when its presolve settles the model
+    nodes = getattr(res,"mip_node_count",None)
+    return [solution], 1 if nodes is None else nodes, res.status == 0
+
+
+def BLP_Int_Constraints(x,y,u,A,B,C,D,s,t,lower_obj,M,zeta,eta):
+
+    #Helper Function: Adds the 0-1 constraints necessary to solve the MILP, specified by binary vectors eta and zeta
+    #eta covers the first len(eta) rows of C, D, t (the lower level inequalities); any remaining rows are equalities
+    
+    #M is either one big-M constant or the dictionary of per-constraint big-Ms from BLP_big_M
+    
+    m = np.shape(zeta)[0]
+    q = np.shape(eta)[0]
+    M = BLP_big_M_vectors(M,m,q)
+
+    mixed_constraints = []
+    for i in range(m):
+        mixed_constraints.append(lower_obj[1][i] + (u.T @ D)[i] <= M["reduced_cost"][i]*zeta[i])
+        mixed_constraints.append(y[i] <= M["y"][i]*(1-zeta[i]))
+
+    for i in range(q):
+        mixed_constraints.append(u[i] <= M["u"][i]*eta[i])
+        mixed_constraints.append(t[i] - (C @ x)[i] - (D @ y)[i] <= M["slack"][i]*(1-eta[i]))
+
+    return mixed_constraints
+
+
+def BLP_branch_and_bound(model,start_time,deadline=np.inf,warm_start=True,state=None,tol=1e-6):
+
+    #Helper Function: Depth-first branch-and-bound over the complementarity binaries zeta (size m) and eta (size q)
+    #Each node fixes some binaries and relaxes the rest to [0,1]; the LP relaxation gives a lower bound for the node
+    #Nodes whose bound is no better than the incumbent are pruned
+    #A node whose relaxed solution already satisfies every complementarity pair is bilevel feasible, so it is not branched further
+    #Otherwise we branch on the free binary with the most violated complementarity pair
+    #Depth-first order means that most nodes are solved right after their parent, one bound away from it;
+    #with warm_start, each node's linear program starts from the previous optimal basis
+    #The open nodes ("stack") are kept in the state dictionary, which can be checkpointed; a state loaded from a checkpoint
+    #continues the search with its open nodes, pruning with the incumbent stored alongside them
+    #Stops early once time.time() passes deadline
+    #Each entry's "profile" holds the phase timings and status of the node's linear program (see BLP_profile),
+    #with the violation check and the branching as "branch"
+    #This is a generator: it yields one LP_solutions entry per node ("value" is inf unless the node produced a bilevel feasible point),
+    #and returns whether the search finished
+
+    m = model["m"]
+    q = model["q"]
+
+    state = {} if state is None else state
+    if state.setdefault("binaries",m+q) != m+q:
+        raise Exception("Error: Checkpoint does not match the problem size")
+    incumbent = state.get("incumbent",{"value": np.inf})["value"]
+    solve = BLP_warm_LP(model,warm_start)
+
+    #Each node stores lower and upper bounds on the binaries (zeta first, then eta)
+    stack = state.setdefault("stack",[(np.zeros(m+q),np.ones(m+q))])
+    while stack:
+        if time.time() > deadline:
+            return False
+        lo, hi = stack.pop()
+
+        profile = {}
+        bound, xVal, yVal, uVal, iterations = solve(lo,hi,profile)
+        tic = time.perf_counter()
+
+        value = np.inf
+        branch = None
+        if bound < incumbent and xVal is not None:
+            violation = BLP_complementarity_violation(model,xVal,yVal,uVal)
+            violation[lo == hi] = 0
+            if violation.max() <= tol:
+                value = bound
+                incumbent = bound
+            else:
+                branch = int(np.argmax(violation))
+        elif bound < incumbent:
+            #Unbounded relaxation: there is no point to measure violations at, so branch on the first free binary
+            free = np.flatnonzero(lo != hi)
+            if len(free) > 0:
+                branch = int(free[0])
+            else:
+                value = bound
+                incumbent = bound
+
+        if branch is not None:
+            down_hi = hi.copy()
+            down_hi[branch] = 0
+            up_lo = lo.copy()
+            up_lo[branch] = 1
+            #Explore first the side that the relaxed solution is closer to
+            if xVal is not None and BLP_complementarity_sides(model,xVal,yVal,uVal)[branch] <= 0:
+                stack += [(up_lo,hi),(lo,down_hi)]
+            else:
+                stack += [(lo,down_hi),(up_lo,hi)]
+        profile["branch"] = time.perf_counter() - tic
+
+        #The node's children are on the stack before the entry is yielded, so a checkpoint taken meanwhile loses nothing
+        yield {"value": value, "bound": bound, "x": xVal, "y": yVal, "u": uVal, "time": time.time()-start_time, "iterations": iterations,
+               "profile": profile}
+
+    return True
+
+
+def BLP_complementarity_sides(model,x,y,u):
+
+    #Helper Function: For every complementarity pair, returns (binary = 0 side) - (binary = 1 side)
+    #zeta_i = 0 forces the reduced cost lower_obj[1][i] + (u.T @ D)[i] to zero, zeta_i = 1 forces y_i <= 0
+    #eta_i = 0 forces u_i to zero, eta_i = 1 forces the slack t_i - (C @ x)[i] - (D @ y)[i] to zero
+
+    q = model["q"]
+    reduced_cost = model["lower_obj"][1] + model["D"].T @ u
+    slack = (model["t"] - model["C"] @ x - model["D"] @ y)[:q]
+    return np.concatenate((np.maximum(reduced_cost,0) - np.maximum(y,0), np.maximum(u[:q],0) - np.maximum(slack,0)))
+
+
+def BLP_complementarity_violation(model,x,y,u):
+
+    #Helper Function: Violation of each complementarity pair (zeta pairs first, then eta pairs)
+    #A pair is satisfied when either of its two sides is (numerically) zero
+
+    q = model["q"]
+    reduced_cost = model["lower_obj"][1] + model["D"].T @ u
+    slack = (model["t"] - model["C"] @ x - model["D"] @ y)[:q]
+    return np.concatenate((np.minimum(np.maximum(reduced_cost,0),np.maximum(y,0)), np.minimum(np.maximum(u[:q],0),np.maximum(slack,0))))
+
+
+def BLP_kth_best(spec,start_time,deadline=np.inf,tol=1e-6):
+
+    #Helper Function: Kth-best method for the linear bilevel program, working directly on the vertices of the shared constraint polyhedron
+    #(upper and lower level constraints together, in (x, y)) instead of the KKT reformulation
+    #The optimum of a linear bilevel program sits at a vertex of this polyhedron, so the vertices are visited in order of increasing
+    #upper-level objective, starting from the LP relaxation's optimal vertex; the next best vertex is always adjacent to one already visited
+    #Each visited vertex is checked for lower-level rationality: y must be optimal for the lower level problem at the vertex's x
+    #(one linear program over the lower level constraints with x fixed); the first rational vertex is optimal
+    #This only holds when the upper level constraints involve x alone: upper level rows on y cut the lower level's response sets,
+    #so the optimum need not be a vertex of the polyhedron any more; such problems are refused
+    #Each entry's "profile" holds the time and status of its linear program (see BLP_profile); finding adjacent vertices is not profiled
+    #Stops early once time.time() passes deadline
+    #This is a generator: it yields one LP_solutions entry per linear program ("value" is inf unless the vertex is rational),
+    #and returns whether the search finished
+
+    n,m,p1,p2,q1,q2 = size_compatibility(spec)
+    A, B, C, D, s, t = spec["A"], spec["B"], spec["C"], spec["D"], spec["s"], spec["t"]
+    upper_objective, lower_objective = spec["upper_objective"], spec["lower_objective"]
+    if sp.csr_matrix(B).count_nonzero() > 0:
+        raise Exception("Error: Kth-best method needs upper level constraints that do not involve y")
+
+    #Inequality rows G @ [x, y] <= h and equality rows E @ [x, y] == e of the shared polyhedron
+    G = sp.vstack((sp.hstack((A[:p1],B[:p1])),sp.hstack((C[:q1],D[:q1])))).toarray()
+    h = np.concatenate((s[:p1],t[:q1]))
+    E = sp.vstack((sp.hstack((A[p1:],B[p1:])),sp.hstack((C[q1:],D[q1:])))).toarray()
+    e = np.concatenate((s[p1:],t[q1:]))
+    c = np.concatenate((upper_objective[0],upper_objective[1]))
+    c0 = float(np.sum(upper_objective[2]))
+    d = lower_objective[1]
+
+    statuses = {0: "optimal", 1: "iteration_limit", 2: "infeasible", 3: "unbounded"}
+    profiled = lambda res, tic: {"solve": time.perf_counter() - tic, "status": statuses.get(res.status,"numerical_error")}
+
+    #Optimal vertex of the LP relaxation (the dual simplex method returns a basic solution)
+    tic = time.perf_counter()
+    res = linprog(c,A_ub=G,b_ub=h,A_eq=E if len(e) > 0 else None,b_eq=e if len(e) > 0 else None,bounds=(None,None),method="highs-ds")
+    if res.status == 3:
+        raise Exception("Error: Kth-best method needs a bounded upper level relaxation")
+    if res.status != 0:
+        yield {"value": np.inf, "x": None, "y": None, "u": None, "time": time.time()-start_time, "profile": profiled(res,tic)}
+        return True
+    yield {"value": np.inf, "bound": res.fun + c0, "x": res.x[:n], "y": res.x[n:], "u": None, "time": time.time()-start_time,
+           "profile": profiled(res,tic)}
+
+    #Vertices waiting to be visited, ordered by upper-level objective; seen holds every vertex ever queued
+    key = lambda v: tuple(np.round(v/tol).astype(np.int64))
+    heap = [(res.fun,0,res.x)]
+    seen = {key(res.x)}
+    count = 1
+
+    while heap:
+        if time.time() > deadline:
+            return False
+        leader, _, v = heapq.heappop(heap)
+        xVal, yVal = v[:n], v[n:]
+
+        #Lower level rationality: compare y with the best lower level response at x
+        tic = time.perf_counter()
+        rhs = t - C @ xVal
+        if q2 > 0:
+            res = linprog(d,A_ub=D[:q1],b_ub=rhs[:q1],A_eq=D[q1:],b_eq=rhs[q1:],bounds=(None,None),method="highs")
+        else:
+            res = linprog(d,A_ub=D[:q1],b_ub=rhs[:q1],bounds=(None,None),method="highs")
+        rational = res.status == 0 and d @ yVal <= res.fun + tol*(1+abs(res.fun))
+
+        value = leader + c0 if rational else np.inf
+        yield {"value": value, "x": xVal, "y": yVal, "u": None, "time": time.time()-start_time, "profile": profiled(res,tic)}
+        if rational:
+            return True
+
+        for w in BLP_adjacent_vertices(G,h,E,v,tol):
+            if key(w) not in seen:
+                seen.add(key(w))
+                heapq.heappush(heap,(c @ w,count,w))
+                count += 1
+
+    return True
+
+
+def BLP_adjacent_vertices(G,h,E,v,tol=1e-6,max_bases=200):
+
+    #Helper Function: Finds the vertices adjacent to the vertex v of the polyhedron G @ z <= h, E @ z == e
+    #A basis of the vertex is a set of active inequality rows that, together with the equality rows, determines v
+    #Leaving one basis row while keeping the others active moves along an edge, up to the first inequality that blocks it
+    #At a degenerate vertex, an edge can be blocked by another active row straight away; that row is then swapped into the basis
+    #and the edges of the new basis are tried as well (at most max_bases bases per vertex)
+    #Returns: list of adjacent vertices (edges that are rays are skipped)
+
+    k = len(v)
+    slack = h - G @ v
+    scale = 1 + np.abs(h)
+    active = np.flatnonzero(slack <= tol*scale)
+
+    #Extend the equality rows to a basis, greedily over the active rows
+    basis = []
+    rank = np.linalg.matrix_rank(E) if len(E) > 0 else 0
+    for i in active:
+        if rank == k:
+            break
+        if np.linalg.matrix_rank(np.vstack((E,G[basis + [i]]))) > rank:
+            basis.append(i)
+            rank += 1
+    if rank < k:
+        return []
+
+    neighbors = []
+    queue = [tuple(sorted(basis))]
+    tried = set(queue)
+    while queue and len(tried) <= max_bases:
+        basis = list(queue.pop())
+        inverse = np.linalg.inv(np.vstack((E,G[basis])))
+        for j, row in enumerate(basis):
+            #Direction leaving row j: G[row] @ direction = -1, all other basis rows (and the equality rows) stay active
+            direction = -inverse[:,len(E)+j]
+            rate = G @ direction
+            rate[basis] = 0
+            blocking = active[rate[active] > tol]
+            if len(blocking) > 0:
+                #Degenerate: the direction leaves the polyhedron at once, so pivot the blocking rows into the basis instead
+                for i in blocking:
+                    new_basis = tuple(sorted(basis[:j] + basis[j+1:] + [i]))
+                    if new_basis not in tried and np.linalg.matrix_rank(np.vstack((E,G[list(new_basis)]))) == k:
+                        tried.add(new_basis)
+                        queue.append(new_basis)
+                continue
+            moving = np.flatnonzero(rate > tol)
+            if len(moving) == 0:
+                continue
+            step = np.min(slack[moving]/rate[moving])
+            neighbors.append(v + step*direction)
+    return neighbors
+
+
+def BLP_strong_duality(spec,u_upper,M_eq,start_time,deadline=np.inf,gap=1e-6,tol=1e-6):
+
+    #Helper Function: Spatial branch-and-bound on the strong duality reformulation, which needs no 0-1 variables
+    #For fixed x, y is optimal for the lower level exactly when some dual u (u.T @ D >= -lower_obj[1], inequality duals nonnegative)
+    #closes the duality gap: lower_obj[1] @ y + (t - C @ x) @ u <= 0 (the same dual feasibility and sign conventions as BLP_compile)
+    #The only nonconvex term is u @ C @ x; every nonzero C[i,j] gets a variable w = u_i * x_j, relaxed by its McCormick envelope
+    #over the box of x (found by linear programs over the shared constraint polyhedron, so x must be bounded) and the box of u
+    #(u_upper for the inequality duals, [-M_eq, M_eq] for the equality duals; BLP_search passes the big-Ms of u from BLP_big_M)
+    #Each node solves the relaxation for a lower bound, and the lower level response at the relaxation's x for a bilevel feasible point:
+    #the lower level optimal value at x, then the best upper-level objective among its optimal y (with the upper level constraints)
+    #Nodes are explored best bound first and split at the x_j (or, once x_j is fixed, the u_i) of the most violated product w = u_i * x_j,
+    #which shrinks the envelope; the number of nodes depends on the boxes and on the relative gap, not on 2^(number of lower level constraints)
+    #Nodes whose bound is within gap (relative) of the incumbent are pruned, so the result is optimal up to gap; tol is the feasibility tolerance
+    #Each entry's "profile" holds the relaxation ("solve") and the lower level response ("response") times and status (see BLP_profile)
+    #Stops early once time.time() passes deadline
+    #This is a generator: it yields one LP_solutions entry per node ("value" is inf unless the node produced a bilevel feasible point),
+    #and returns whether the search finished
+
+    n,m,p1,p2,q1,q2 = size_compatibility(spec)
+    A, B, C, D = sp.csr_matrix(spec["A"]), sp.csr_matrix(spec["B"]), sp.csr_matrix(spec["C"]), sp.csr_matrix(spec["D"])
+    s, t = spec["s"], spec["t"]
+    upper_objective, lower_objective = spec["upper_objective"], spec["lower_objective"]
+    d = np.asarray(lower_objective[1],dtype=float)
+    c0 = float(np.sum(upper_objective[2]))
+    r = q1 + q2
+    statuses = {0: "optimal", 1: "iteration_limit", 2: "infeasible", 3: "unbounded"}
+
+    #Products u_i * x_j with C[i,j] != 0, one w column each
+    products = C.tocoo()
+    K = len(products.data)
+    Z = lambda rows, cols: sp.csr_matrix((rows,cols))
+
+    #Variable vector [x, y, u, w]; the rows that do not depend on the box of the node
+    A_ub = sp.bmat([
+        [A[:p1], B[:p1], Z(p1,r), Z(p1,K)],                                                     #Upper level inequality constraints
+        [C[:q1], D[:q1], Z(q1,r), Z(q1,K)],                                                     #Lower level inequality constraints
+        [Z(m,n), Z(m,m), -D.T, Z(m,K)],                                                         #u.T @ D >= -lower_obj[1]
+        [Z(1,n), sp.csr_matrix(d.reshape(1,-1)), sp.csr_matrix(t.reshape(1,-1)), sp.csr_matrix(-products.data.reshape(1,-1))], #Duality gap <= 0
+    ],format="csr")
+    b_ub = np.concatenate((s[:p1], t[:q1], d, [0]))
+    A_eq = sp.bmat([[A[p1:], B[p1:], Z(p2,r), Z(p2,K)], [C[q1:], D[q1:], Z(q2,r), Z(q2,K)]],format="csr")
+    b_eq = np.concatenate((s[p1:], t[q1:]))
+    c = np.concatenate((upper_objective[0], upper_objective[1], np.zeros(r+K)))
+    equalities = {"A_eq": A_eq, "b_eq": b_eq} if len(b_eq) > 0 else {}
+
+    #Box of x over the shared constraint polyhedron of both levels
+    P_ub = sp.vstack((sp.hstack((A[:p1],B[:p1])),sp.hstack((C[:q1],D[:q1]))),format="csr")
+    P_eq = sp.vstack((sp.hstack((A[p1:],B[p1:])),sp.hstack((C[q1:],D[q1:]))),format="csr")
+    P_equalities = {"A_eq": P_eq, "b_eq": np.concatenate((s[p1:],t[q1:]))} if len(b_eq) > 0 else {}
+    box = np.zeros((2,n))
+    for j in range(n):
+        for side, sign in enumerate([1,-1]):
+            res = linprog(sign*np.eye(n+m)[j],A_ub=P_ub,b_ub=np.concatenate((s[:p1],t[:q1])),bounds=(None,None),method="highs",**P_equalities)
+            if res.status == 2:
+                yield {"value": np.inf, "x": None, "y": None, "u": None, "time": time.time()-start_time}
+                return True
+            if res.status != 0:
+                raise Exception("Error: The strong duality method needs x to be bounded by the constraints")
+            box[side,j] = sign*res.fun
+    x_lower, x_upper = box
+    u_lower = np.concatenate((np.zeros(q1),-M_eq*np.ones(q2)))
+    u_upper = np.concatenate((u_upper,M_eq*np.ones(q2)))
+
+    def envelope(x_lower,x_upper,u_lower,u_upper):
+        #McCormick inequalities of every product w = u_i * x_j over the node's box, as rows over [x, y, u, w]
+        i, j = products.row, products.col
+        rows = np.arange(4*K)
+        coefs = [(u_lower[i],x_lower[j],-1,u_lower[i]*x_lower[j]), (u_upper[i],x_upper[j],-1,u_upper[i]*x_upper[j]),
+                 (-u_upper[i],-x_lower[j],1,-u_upper[i]*x_lower[j]), (-u_lower[i],-x_upper[j],1,-u_lower[i]*x_upper[j])]
+        a_x, a_u, a_w, rhs = [np.concatenate(part) for part in zip(*[[np.broadcast_to(a,K) for a in family] for family in coefs])]
+        cols = np.concatenate((np.tile(j,4),n+m+np.tile(i,4),n+m+r+np.tile(np.arange(K),4)))
+        matrix = sp.csr_matrix((np.concatenate((a_x,a_u,a_w)),(np.tile(rows,3),cols)),shape=(4*K,n+m+r+K))
+        return matrix, rhs
+
+    def response(x):
+        #Lower level optimal value at x, then the best upper-level objective among the lower level optimal y
+        rhs = t - C @ x
+        lower_equalities = {"A_eq": D[q1:], "b_eq": rhs[q1:]} if q2 > 0 else {}
+        res = linprog(d,A_ub=D[:q1],b_ub=rhs[:q1],bounds=(None,None),method="highs",**lower_equalities)
+        if res.status != 0:
+            return None
+        u = np.concatenate((-res.ineqlin.marginals,-res.eqlin.marginals if q2 > 0 else []))
+        optimal = res.fun + tol*(1+abs(res.fun))
+        G = sp.vstack((D[:q1],sp.csr_matrix(d.reshape(1,-1)),B[:p1]),format="csr")
+        h = np.concatenate((rhs[:q1],[optimal],s[:p1] - A[:p1] @ x))
+        upper_equalities = {"A_eq": sp.vstack((D[q1:],B[p1:])), "b_eq": np.concatenate((rhs[q1:],s[p1:] - A[p1:] @ x))} if q2+p2 > 0 else {}
+        res = linprog(upper_objective[1],A_ub=G,b_ub=h,bounds=(None,None),method="highs",**upper_equalities)
+        if res.status != 0:
+            return None
+        return upper_objective[0] @ x + res.fun + c0, res.x, u
+
+    x_width = np.maximum(x_upper - x_lower,tol)
+    u_width = np.maximum(u_upper - u_lower,tol)
+    incumbent = np.inf
+    heap = [(-np.inf,0,x_lower,x_upper,u_lower,u_upper)]
+    count = 1
+    while heap:
+        if time.time() > deadline:
+            return False
+        parent_bound, _, x_lower, x_upper, u_lower, u_upper = heapq.heappop(heap)
+        if parent_bound >= incumbent - gap*(1+abs(incumbent)):
+            continue
+
+        tic = time.perf_counter()
+        rows, rhs = envelope(x_lower,x_upper,u_lower,u_upper)
+        bounds = np.column_stack((np.concatenate((x_lower,-np.inf*np.ones(m),u_lower,-np.inf*np.ones(K))),
+                                  np.concatenate((x_upper,np.inf*np.ones(m),u_upper,np.inf*np.ones(K)))))
+        res = linprog(c,A_ub=sp.vstack((A_ub,rows),format="csr"),b_ub=np.concatenate((b_ub,rhs)),bounds=bounds,method="highs",**equalities)
+        profile = {"solve": time.perf_counter() - tic, "status": statuses.get(res.status,"numerical_error")}
+        if res.status != 0:
+            #An infeasible box holds no bilevel feasible point; an unbounded relaxation gives no bound to branch on
+            yield {"value": np.inf, "x": None, "y": None, "u": None, "time": time.time()-start_time, "profile": profile}
+            continue
+        bound = res.fun + c0
+        v = res.x
+        xVal, yVal, uVal = v[:n], v[n:n+m], v[n+m:n+m+r]
+        u, w = uVal, v[n+m+r:]
+
+        #A bilevel feasible point at the relaxation's x
+        value = np.inf
+        tic = time.perf_counter()
+        candidate = response(xVal)
+        profile["response"] = time.perf_counter() - tic
+        if candidate is not None:
+            value, yVal, uVal = candidate
+            incumbent = min(incumbent,value)
+
+        if bound < incumbent - gap*(1+abs(incumbent)) and K > 0:
+            violation = np.abs(products.data*(w - u[products.row]*xVal[products.col]))
+            k = int(np.argmax(violation))
+            i, j = products.row[k], products.col[k]
+            if violation[k] > tol*(1+abs(bound)):
+                #Split whichever of x_j and u_i has the wider interval relative to the root box,
+                #at the relaxation's value unless it sits at the edge
+                if (x_upper[j] - x_lower[j])/x_width[j] >= (u_upper[i] - u_lower[i])/u_width[i]:
+                    low, high, point, split = x_lower, x_upper, xVal[j], j
+                else:
+                    low, high, point, split = u_lower, u_upper, u[i], i
+                width = high[split] - low[split]
+                if not low[split] + 0.01*width < point < high[split] - 0.01*width:
+                    point = (low[split] + high[split])/2
+                if width > tol*(1+abs(low[split])+abs(high[split])):
+                    for side in range(2):
+                        child_low, child_high = low.copy(), high.copy()
+                        if side == 0:
+                            child_high[split] = point
+                        else:
+                            child_low[split] = point
+                        child = (child_low,child_high,u_lower,u_upper) if low is x_lower else (x_lower,x_upper,child_low,child_high)
+                        heapq.heappush(heap,(bound,count) + child)
+                        count += 1
+
+        yield {"value": value, "bound": bound, "x": xVal, "y": yVal, "u": uVal, "time": time.time()-start_time, "profile": profile}
+
+    return True
+
+
+def BLP_spec(upper_objective=None,lower_objective=None,upper_ineq=None,upper_eq=None,lower_ineq=None,lower_eq=None):
+
+    #Helper Function: Converts the nested-list problem description into a compact specification with sparse constraint blocks
+    #Each list of [x coefficients, y coefficients, constant] triples is stacked into two matrices and a vector in one step
+    #Inequality constraints come first in A, B, s and C, D, t, followed by the equality constraints
+    #Returns: dictionary with "upper_objective", "lower_objective" ([x, y, constant]), sparse "A", "B", "C", "D",
+    #vectors "s", "t" and the equality counts "p2", "q2"; this dictionary can also be built directly and passed to solve_BLP
+
+    n = np.size(upper_objective[0])
+    m = np.size(upper_objective[1])
+
+    def stack(rows,name):
+        rows = [] if rows is None else rows
+        blocks = []
+        for j, (part, width) in enumerate([("x",n),("y",m),("const",1)]):
+            try:
+                block = np.array([row[j] for row in rows],dtype=float).reshape(len(rows),-1) if len(rows) > 0 else np.zeros((0,width))
+            except ValueError:
+                block = None
+            if block is None or block.shape[1] != width:
+                #Only when the stacked block is malformed do we walk the rows to report the offending constraint
+                bad = next((i for i in range(len(rows)) if np.size(rows[i][j]) != width),0)
+                raise Exception(f"Error: {name} {part} constraint {bad} has wrong size")
+            blocks.append(block.reshape(len(rows),width))
+        return blocks
+
+    A_ineq, B_ineq, s_ineq = stack(upper_ineq,"Upper_ineq")
+    A_eq, B_eq, s_eq = stack(upper_eq,"Upper_eq")
+    C_ineq, D_ineq, t_ineq = stack(lower_ineq,"Lower_ineq")
+    C_eq, D_eq, t_eq = stack(lower_eq,"Lower_eq")
+
+    objective = lambda obj: [np.asarray(obj[0],dtype=float).ravel(),np.asarray(obj[1],dtype=float).ravel(),np.asarray(obj[2],dtype=float).ravel()]
+
+    return {"upper_objective": objective(upper_objective), "lower_objective": objective(lower_objective),
+            "A": sp.csr_matrix(np.vstack((A_ineq,A_eq))), "B": sp.csr_matrix(np.vstack((B_ineq,B_eq))), "s": np.concatenate((s_ineq,s_eq)).ravel(),
+            "C": sp.csr_matrix(np.vstack((C_ineq,C_eq))), "D": sp.csr_matrix(np.vstack((D_ineq,D_eq))), "t": np.concatenate((t_ineq,t_eq)).ravel(),
+            "p2": len(s_eq), "q2": len(t_eq)}
+
+
+def size_compatibility(spec):
+
+    #Helper Function: Sanity check to ensure that the input has the right dimensions
+    #The whole specification is checked block by block, so the cost does not grow with a Python loop over constraints
+    #Returns: n (size of x), m (size of y), p1, p2 (upper inequality/equality counts), q1, q2 (lower inequality/equality counts)
+
+    upper_objective = spec["upper_objective"]
+    lower_objective = spec["lower_objective"]
+    n = np.shape(upper_objective[0])[0] #x
+    m = np.shape(upper_objective[1])[0] #y
+    p2 = spec["p2"]
+    q2 = spec["q2"]
+    p1 = np.shape(spec["s"])[0] - p2
+    q1 = np.shape(spec["t"])[0] - q2
+
+    if np.size(upper_objective[2]) != 1:
+        raise Exception("Error: Upper_objective const has wrong size")
+
+    if np.shape(lower_objective[0])[0] != n:
+        raise Exception("Error: Lower_Objective x has wrong size")
+
+    if np.shape(lower_objective[1])[0] != m:
+        raise Exception("Error: Lower_Objective y has wrong size")
+
+    if np.size(lower_objective[2]) != 1:
+        raise Exception("Error: Lower_objective const has wrong size")
+
+    if p1 < 0 or q1 < 0:
+        raise Exception("Error: More equality constraints than constraints")
+
+    for name, X, Y, r in [("Upper",spec["A"],spec["B"],spec["s"]),("Lower",spec["C"],spec["D"],spec["t"])]:
+        if np.shape(X) != (np.shape(r)[0],n):
+            raise Exception(f"Error: {name} level x constraint matrix has wrong size")
+        if np.shape(Y) != (np.shape(r)[0],m):
+            raise Exception(f"Error: {name} level y constraint matrix has wrong size")
+
+    return n,m,p1,p2,q1,q2
+
+
+def BLP_presolve(spec,redundancy_LPs=True,move_sign_rows=True,tol=1e-9):
+
+    #Helper Function: Shrinks a specification (see BLP_spec) before the search, since every lower level inequality costs an eta binary
+    #and every y variable a zeta binary, and each binary doubles the number of assignments
+    #The following reductions are repeated until none applies; each one leaves the bilevel program unchanged
+    #(reduction 3 only as long as the search treats y >= 0 as part of the lower level, as the KKT reformulation does):
+        #1) Variables fixed by singleton constraints (upper level x-only rows for x, lower level y-only rows for y) are substituted out,
+        #   and constraints left with no variables are dropped when they hold
+        #2) Lower level constraints without y only restrict x, so they move to the upper level
+        #3) Lower level sign constraints -a*y_j <= 0 repeat the sign condition y_j >= 0 that the KKT reformulation already pairs with zeta_j;
+        #   they move to the upper level, which keeps y_j >= 0 without a second binary for it
+        #   (only with move_sign_rows: the kth_best and strong_duality methods solve the lower level with free y, so for them
+        #   these rows must stay in the lower level)
+        #4) Inequalities that are positive multiples of another one with a looser right-hand side are dropped
+        #5) With redundancy_LPs, a lower level inequality is dropped when a linear program shows that the remaining lower level constraints,
+        #   the upper level constraints on x alone and the sign conditions on y imply it
+    #Returns: the reduced specification and a dictionary used by BLP_postsolve to map its solutions back, which also holds a report
+    #("binaries_eliminated", the rows removed or moved, the fixed variables and the linear programs used)
+
+    n, m, p1, p2, q1, q2 = size_compatibility(spec)
+    upper_obj = [np.array(part,dtype=float).ravel() for part in spec["upper_objective"]]
+    lower_obj = [np.array(part,dtype=float).ravel() for part in spec["lower_objective"]]
+    A, B, s = sp.csr_matrix(spec["A"],dtype=float), sp.csr_matrix(spec["B"],dtype=float), np.array(spec["s"],dtype=float)
+    C, D, t = sp.csr_matrix(spec["C"],dtype=float), sp.csr_matrix(spec["D"],dtype=float), np.array(spec["t"],dtype=float)
+
+    #Every block of constraints is kept apart as [x coefficients, y coefficients, right-hand side]; lower level rows also keep their
+    #original index, which is where their dual variable goes in u
+    upper = {"ineq": [A[:p1],B[:p1],s[:p1]], "eq": [A[p1:],B[p1:],s[p1:]]}
+    lower = {"ineq": [C[:q1],D[:q1],t[:q1],np.arange(q1)], "eq": [C[q1:],D[q1:],t[q1:],np.arange(q1,q1+q2)]}
+    x_kept, y_kept = np.arange(n), np.arange(m)
+    x_fixed, y_fixed = np.full(n,np.nan), np.full(m,np.nan)
+    report = {"binaries_eliminated": 0, "lower_rows_removed": 0, "lower_rows_moved": 0, "upper_rows_removed": 0,
+              "fixed_x": 0, "fixed_y": 0, "redundancy_LPs": 0}
+
+    def select(block,rows):
+        return [part[rows] for part in block]
+
+    def append(block,X,Y,r):
+        block[0] = sp.vstack((block[0],X),format="csr")
+        block[1] = sp.vstack((block[1],Y),format="csr")
+        block[2] = np.concatenate((block[2],r))
+
+    def singletons(X,Y,r):
+        #Rows with exactly one nonzero, all of it in X: returns the rows, their column and their coefficient
+        rows = np.flatnonzero((X.getnnz(axis=1) == 1) & (Y.getnnz(axis=1) == 0))
+        coo = X[rows].tocoo()
+        order = np.argsort(coo.row)
+        return rows, coo.col[order], coo.data[order]
+
+    def variable_bounds(size,ineq,eq,lower_default):
+        #Bounds on each variable implied by the singleton rows of one level (ineq and eq are (X, Y, r) with X the variable's block)
+        lb, ub = np.full(size,lower_default), np.full(size,np.inf)
+        rows, cols, coefs = singletons(*ineq)
+        np.minimum.at(ub,cols[coefs > 0],ineq[2][rows[coefs > 0]]/coefs[coefs > 0])
+        np.maximum.at(lb,cols[coefs < 0],ineq[2][rows[coefs < 0]]/coefs[coefs < 0])
+        rows, cols, coefs = singletons(*eq)
+        np.minimum.at(ub,cols,eq[2][rows]/coefs)
+        np.maximum.at(lb,cols,eq[2][rows]/coefs)
+        return lb, ub
+
+    def substitute(fixed,values,column):
+        #Removes the fixed columns of x (column 0) or y (column 1) from every block, moving their contribution to the right-hand sides
+        keep = np.ones(upper["ineq"][column].shape[1],dtype=bool)
+        keep[fixed] = False
+        for block in list(upper.values()) + list(lower.values()):
+            block[2] = block[2] - block[column][:,fixed] @ values
+            block[column] = block[column][:,keep]
+        upper_obj[2] += upper_obj[column][fixed] @ values
+        lower_obj[2] += lower_obj[column][fixed] @ values
+        upper_obj[column] = upper_obj[column][keep]
+        lower_obj[column] = lower_obj[column][keep]
+        return keep
+
+    def drop_empty(block,level,kind):
+        empty = (block[0].getnnz(axis=1) == 0) & (block[1].getnnz(axis=1) == 0)
+        holds = block[2] >= -tol if kind == "ineq" else np.abs(block[2]) <= tol
+        #An empty row that does not hold makes the problem infeasible; it is kept so that the search reports it
+        drop = empty & holds
+        report[f"{level}_rows_removed"] += int(drop.sum())
+        return select(block,~drop)
+
+    def parallel(X,Y,r):
+        #Rows that are a positive multiple of an earlier row with a right-hand side no tighter than it
+        rows = sp.hstack((X,Y),format="csr")
+        norms = np.sqrt(np.asarray(rows.multiply(rows).sum(axis=1)).ravel())
+        redundant = np.zeros(len(r),dtype=bool)
+        tightest = {}
+        for i in np.flatnonzero(norms > 0):
+            row = rows[i]
+            key = (tuple(row.indices[np.argsort(row.indices)]),tuple(np.round(row.data[np.argsort(row.indices)]/norms[i],9)))
+            if key in tightest:
+                j = tightest[key]
+                if r[i]/norms[i] >= r[j]/norms[j] - tol:
+                    redundant[i] = True
+                    continue
+                redundant[j] = True
+            tightest[key] = i
+        return redundant
+
+    changed = True
+    while changed:
+        changed = False
+
+        #1) Fixed variables; x may only be fixed while another x remains (and likewise y), so that no level loses all its variables
+        lb, ub = variable_bounds(len(x_kept),upper["ineq"],upper["eq"],-np.inf)
+        fixed = np.flatnonzero(np.abs(ub - lb) <= tol*(1 + np.abs(lb)))[:len(x_kept)-1]
+        if len(fixed) > 0:
+            x_fixed[x_kept[fixed]] = lb[fixed]
+            x_kept = x_kept[substitute(fixed,lb[fixed],0)]
+            report["fixed_x"] += len(fixed)
+            changed = True
+        flip = lambda block: [block[1],block[0],block[2]]
+        lb, ub = variable_bounds(len(y_kept),flip(lower["ineq"]),flip(lower["eq"]),-np.inf)
+        fixed = np.flatnonzero((np.abs(ub - lb) <= tol*(1 + np.abs(lb))) & (lb >= -tol))[:len(y_kept)-1]
+        if len(fixed) > 0:
+            y_fixed[y_kept[fixed]] = lb[fixed]
+            y_kept = y_kept[substitute(fixed,lb[fixed],1)]
+            report["fixed_y"] += len(fixed)
+            changed = True
+        for kind in ["ineq","eq"]:
+            upper[kind] = drop_empty(upper[kind],"upper",kind)
+            lower[kind] = drop_empty(lower[kind],"lower",kind)
+
+        #2) and 3) Lower level rows that only restrict x, and lower level sign constraints on y, move to the upper level
+        for kind in ["ineq","eq"]:
+            X, Y, r, index = lower[kind]
+            move = (Y.getnnz(axis=1) == 0) & (X.getnnz(axis=1) > 0)
+            if kind == "ineq" and move_sign_rows:
+                rows, cols, coefs = singletons(Y,X,r)
+                move[rows[(coefs < 0) & (np.abs(r[rows]) <= tol)]] = True
+            if move.any():
+                append(upper[kind],X[move],Y[move],r[move])
+                lower[kind] = select(lower[kind],~move)
+                report["lower_rows_moved"] += int(move.sum())
+                changed = True
+
+        #4) Parallel inequalities within each level
+        for level, blocks in [("upper",upper),("lower",lower)]:
+            redundant = parallel(*blocks["ineq"][:3])
+            if redundant.any():
+                blocks["ineq"] = select(blocks["ineq"],~redundant)
+                report[f"{level}_rows_removed"] += int(redundant.sum())
+                changed = True
+
+        #5) Lower level inequalities implied by the rest, one at a time so that two rows never justify dropping each other
+        if redundancy_LPs and not changed:
+            X, Y, r, index = lower["ineq"]
+            x_only = lambda block: block[1].getnnz(axis=1) == 0
+            rows, cols, coefs = singletons(upper["ineq"][1],upper["ineq"][0],upper["ineq"][2])
+            nonnegative = np.zeros(len(y_kept),dtype=bool)
+            nonnegative[cols[(coefs < 0) & (np.abs(upper["ineq"][2][rows]) <= tol)]] = True
+            bounds = np.column_stack((np.full(len(x_kept),-np.inf),np.full(len(x_kept),np.inf)))
+            bounds = np.vstack((bounds,np.column_stack((np.where(nonnegative,0,-np.inf),np.full(len(y_kept),np.inf)))))
+            Z = lambda block: sp.csr_matrix((int(x_only(block).sum()),len(y_kept)))
+            keep = np.ones(len(r),dtype=bool)
+            for i in range(len(r)):
+                keep[i] = False
+                A_ub = sp.vstack((sp.hstack((X[keep],Y[keep])),sp.hstack((upper["ineq"][0][x_only(upper["ineq"])],Z(upper["ineq"])))),format="csr")
+                b_ub = np.concatenate((r[keep],upper["ineq"][2][x_only(upper["ineq"])]))
+                A_eq = sp.vstack((sp.hstack((lower["eq"][0],lower["eq"][1])),sp.hstack((upper["eq"][0][x_only(upper["eq"])],Z(upper["eq"])))),format="csr")
+                b_eq = np.concatenate((lower["eq"][2],upper["eq"][2][x_only(upper["eq"])]))
+                objective = -sp.hstack((X[i],Y[i])).toarray().ravel()
+                constraints = {"A_eq": A_eq, "b_eq": b_eq} if len(b_eq) > 0 else {}
+                res = linprog(objective,A_ub=A_ub if len(b_ub) > 0 else None,b_ub=b_ub if len(b_ub) > 0 else None,
+                              bounds=bounds,method="highs",**constraints)
+                report["redundancy_LPs"] += 1
+                if not (res.status == 0 and -res.fun <= r[i] + tol*(1 + abs(r[i]))):
+                    keep[i] = True
+            if not keep.all():
+                lower["ineq"] = select(lower["ineq"],keep)
+                report["lower_rows_removed"] += int((~keep).sum())
+                changed = True
+
+    reduced = {"upper_objective": [upper_obj[0],upper_obj[1],upper_obj[2]], "lower_objective": [lower_obj[0],lower_obj[1],lower_obj[2]],
+               "A": sp.vstack((upper["ineq"][0],upper["eq"][0]),format="csr"), "B": sp.vstack((upper["ineq"][1],upper["eq"][1]),format="csr"),
+               "s": np.concatenate((upper["ineq"][2],upper["eq"][2])),
+               "C": sp.vstack((lower["ineq"][0],lower["eq"][0]),format="csr"), "D": sp.vstack((lower["ineq"][1],lower["eq"][1]),format="csr"),
+               "t": np.concatenate((lower["ineq"][2],lower["eq"][2])),
+               "p2": len(upper["eq"][2]), "q2": len(lower["eq"][2])}
+    report["binaries_eliminated"] = (m + q1) - (len(y_kept) + len(lower["ineq"][2]))
+    return reduced, {"x_kept": x_kept, "x_fixed": x_fixed, "y_kept": y_kept, "y_fixed": y_fixed,
+                     "u_kept": np.concatenate((lower["ineq"][3],lower["eq"][3])), "u_size": q1 + q2, "report": report}
+
+
+def BLP_postsolve(presolved,LP_solutions):
+
+    #Helper Function: Maps LP_solutions entries of a specification reduced by BLP_presolve back to the original variables
+    #Fixed variables get their fixed value, and constraints that were removed or moved to the upper level get a zero dual variable
+    #Returns: the list of mapped entries (values and all other fields are unchanged)
+
+    mapped = []
+    for sol in LP_solutions:
+        sol = dict(sol)
+        if sol.get("x") is not None:
+            x = presolved["x_fixed"].copy()
+            x[presolved["x_kept"]] = sol["x"]
+            y = presolved["y_fixed"].copy()
+            y[presolved["y_kept"]] = sol["y"]
+            sol["x"], sol["y"] = x, y
+        if sol.get("u") is not None:
+            u = np.zeros(presolved["u_size"])
+            u[presolved["u_kept"]] = sol["u"]
+            sol["u"] = u
+        mapped.append(sol)
+    return mapped
+
+
+def process_LP_solutions(LP_solutions):
+    iterates = []
+    iteration_values = []
+    iteration_times = []
+    cur_val = np.inf
+    cur_iterates = np.array([])
+
+    for i in range(len(LP_solutions)):
+        if(LP_solutions[i]["value"] == "inf"):
+            iteration_values.append(cur_val)
+            iterates.append(cur_iterates)
+            iteration_times.append(LP_solutions[i]["time"])
+        elif(LP_solutions[i]["value"] >= cur_val):
+            iteration_values.append(cur_val)
+            iterates.append(cur_iterates)
+            iteration_times.append(LP_solutions[i]["time"])
+        else:
+            cur_val = LP_solutions[i]["value"]
+            cur_iterates = [LP_solutions[i]["x"],LP_solutions[i]["y"]]
+            iteration_values.append(cur_val)
+            iterates.append(cur_iterates)
+            iteration_times.append(LP_solutions[i]["time"])
+
+    return iterates, iteration_values, iteration_times
+
+
+def BLP_profile(LP_solutions,total_time=None):
+
+    #Helper Function: Aggregates the "profile" dictionaries of LP_solutions entries into one summary
+    #Every entry's profile holds the seconds spent in the phases of its linear program, which depend on the method:
+        #"bounds": setting the column bounds of the compiled model; "build": building the cvx constraints in Python (naive)
+        #"canonicalize": cvx canonicalization (naive); "solve": the solver itself; "extract": reading back the solution
+        #"conflict": conflict analysis after an infeasible assignment (enumerate); "branch": violation check and branching (branch_and_bound)
+        #"response": the lower level response at a node's x (strong_duality)
+    #and the "status" of the linear program ("optimal", "infeasible", "unbounded", or the solver's own status otherwise)
+    #With total_time (the wall time of the search), the time spent outside every profiled phase is reported as "other"
+    #(with the parallel method, the phases add up the time of every worker, so they can exceed the wall time)
+    #Returns: dictionary with the number of profiled linear programs ("LPs"), the "total", "mean" and "max" seconds of every phase,
+    #each phase's "share" of the profiled time, and the count of each status
+
+    profiles = [sol["profile"] for sol in LP_solutions if sol.get("profile") is not None]
+    phases = {}
+    for profile in profiles:
+        for phase, seconds in profile.items():
+            if phase not in ["status","fallback"]:
+                phases.setdefault(phase,[]).append(seconds)
+
+    profiled_time = float(sum(np.sum(seconds) for seconds in phases.values()))
+    summary = {"LPs": len(profiles), "phases": {}, "status": {}}
+    for phase, seconds in phases.items():
+        summary["phases"][phase] = {"total": float(np.sum(seconds)), "mean": float(np.mean(seconds)), "max": float(np.max(seconds)),
+                                    "share": float(np.sum(seconds))/profiled_time if profiled_time > 0 else 0.0}
+    for profile in profiles:
+        summary["status"][profile["status"]] = summary["status"].get(profile["status"],0) + 1
+    if total_time is not None:
+        summary["total_time"] = float(total_time)
+        summary["other"] = max(float(total_time) - profiled_time,0.0)
+    return summary
+
+
+def generate_BLP(n,m,q,q2=0,p=0,density=1.0,seed=0):
+
+    #Helper Function: Generates a random linear bilevel program as a specification with sparse constraint matrices (see BLP_spec)
+    #x is boxed in [0,10] at the upper level, together with p random upper-level inequality constraints in x only
+    #The lower level has q random inequality constraints plus y >= 0 and sum(y) <= 10*m, and q2 random equality constraints
+    #density is the fraction of nonzero entries in the random constraint rows
+    #The right-hand sides are built around a random point (x0,y0), so the problem is feasible and both levels are bounded
+
+    rng = np.random.default_rng(seed)
+    x0 = rng.uniform(0,5,n)
+    y0 = rng.uniform(0,5,m)
+    random_block = lambda rows, cols: sp.random(rows,cols,density=density,format="csr",random_state=rng,
+                                                data_rvs=lambda size: np.round(rng.normal(size=size),1))
+
+    A_rand = random_block(p,n)
+    C_ineq, D_ineq = random_block(q,n), random_block(q,m)
+    C_eq, D_eq = random_block(q2,n), random_block(q2,m)
+
+    A = sp.vstack((-sp.identity(n),sp.identity(n),A_rand),format="csr")
+    B = sp.csr_matrix((2*n+p,m))
+    s = np.concatenate((np.zeros(n),10*np.ones(n),A_rand @ x0 + rng.uniform(0,1,p)))
+    C = sp.vstack((C_ineq,sp.csr_matrix((m+1,n)),C_eq),format="csr")
+    D = sp.vstack((D_ineq,-sp.identity(m),np.ones((1,m)),D_eq),format="csr")
+    t = np.concatenate((C_ineq @ x0 + D_ineq @ y0 + rng.uniform(0,1,q),np.zeros(m),[10*m],C_eq @ x0 + D_eq @ y0))
+
+    return {"upper_objective": [np.round(rng.normal(size=n),1),np.round(rng.normal(size=m),1),np.array([0.0])],
+            "lower_objective": [np.round(rng.normal(size=n),1),np.round(rng.normal(size=m),1),np.array([0.0])],
+            "A": A, "B": B, "s": s, "C": C, "D": D, "t": t, "p2": 0, "q2": q2}
+
+
+def BLP_read_mps(path):
+
+    #Helper Function: Reads a linear program in (free or fixed) MPS format, line by line, into sparse form
+    #Files ending in .gz are decompressed on the fly; fields are split at whitespace, so names must not contain spaces
+    #Sections NAME, OBJSENSE, ROWS, COLUMNS (with integer MARKER lines), RHS, RANGES, BOUNDS and ENDATA are understood;
+    #the first N row is the objective and other N rows are ignored; columns default to the bounds [0, inf)
+    #Integrality is recorded but not used by solve_BLP, which solves the continuous bilevel program
+    #Returns: dictionary with the "name", the column and row names in order ("columns", "rows"), the row "types" (L, G or E),
+    #the sparse constraint "matrix", "rhs", "ranges", the objective "c" and its "constant", the "maximize" flag,
+    #the column bounds "lower" and "upper" and the boolean "integer" column marker
+
+    opener = gzip.open if str(path).endswith(".gz") else open
+    name = ""
+    maximize = False
+    objective = None
+    columns, rows, types = {}, {}, []
+    entries_row, entries_col, entries_val = [], [], []
+    c, rhs, ranges, bounds, integer = {}, {}, {}, [], {}
+    constant = 0.0
+    section = None
+    in_integer_block = False
+
+    with opener(path,"rt") as f:
+        for line in f:
+            if not line.strip() or line[0] == "*":
+                continue
+            tokens = line.split()
+            if not line[0].isspace():
+                section = tokens[0].upper()
+                if section == "NAME":
+                    name = tokens[1] if len(tokens) > 1 else ""
+                elif section == "OBJSENSE" and len(tokens) > 1:
+                    maximize = tokens[1].upper() in ["MAX","MAXIMIZE"]
+                elif section == "ENDATA":
+                    break
+                continue
+
+            if section == "OBJSENSE":
+                maximize = tokens[0].upper() in ["MAX","MAXIMIZE"]
+            elif section == "ROWS":
+                kind, row = tokens[0].upper(), tokens[1]
+                if kind == "N":
+                    objective = row if objective is None else objective
+                else:
+                    rows[row] = len(rows)
+                    types.append(kind)
+            elif section == "COLUMNS":
+                if "'MARKER'" in tokens:
+                    in_integer_block = "'INTORG'" in tokens
+                    continue
+                column = tokens[0]
+                if column not in columns:
+                    columns[column] = len(columns)
+                    integer[column] = in_integer_block
+                j = columns[column]
+                for row, value in zip(tokens[1::2],tokens[2::2]):
+                    if row == objective:
+                        c[j] = c.get(j,0.0) + float(value)
+                    elif row in rows:
+                        entries_row.append(rows[row])
+                        entries_col.append(j)
+                        entries_val.append(float(value))
+            elif section in ["RHS","RANGES"]:
+                #The name of the right-hand side (or range) vector is optional
+                pairs = tokens[1:] if len(tokens) % 2 == 1 else tokens
+                for row, value in zip(pairs[0::2],pairs[1::2]):
+                    if row == objective and section == "RHS":
+                        constant = -float(value)
+                    elif row in rows:
+                        (rhs if section == "RHS" else ranges)[rows[row]] = float(value)
+            elif section == "BOUNDS":
+                #The name of the bound vector is optional; the column is the first known column name after the bound type
+                kind = tokens[0].upper()
+                column = next((token for token in tokens[1:3] if token in columns),None)
+                if column is None:
+                    raise Exception(f"Error: Unknown column in bound line '{line.strip()}'")
+                position = tokens.index(column,1)
+                value = float(tokens[position+1]) if len(tokens) > position+1 else None
+                bounds.append((kind,column,value))
+
+    N = len(columns)
+    lower, upper = np.zeros(N), np.full(N,np.inf)
+    for kind, column, value in bounds:
+        j = columns[column]
+        if kind == "UP":
+            upper[j] = value
+            #An upper bound below zero on a column without a lower bound makes it unbounded below (MPS convention)
+            if value < 0 and lower[j] == 0:
+                lower[j] = -np.inf
+        elif kind in ["LO","LI"]:
+            lower[j] = value
+        elif kind in ["UI"]:
+            upper[j] = value
+        elif kind == "FX":
+            lower[j] = upper[j] = value
+        elif kind == "FR":
+            lower[j], upper[j] = -np.inf, np.inf
+        elif kind == "MI":
+            lower[j] = -np.inf
+        elif kind == "PL":
+            upper[j] = np.inf
+        elif kind == "BV":
+            lower[j], upper[j] = 0, 1
+            integer[column] = True
+        else:
+            raise Exception(f"Error: Unknown bound type {kind}")
+
+    return {"name": name, "columns": list(columns), "rows": list(rows), "types": np.array(types),
+            "matrix": sp.csr_matrix((entries_val,(entries_row,entries_col)),shape=(len(rows),N)),
+            "rhs": np.array([rhs.get(i,0.0) for i in range(len(rows))]), "ranges": np.array([ranges.get(i,np.nan) for i in range(len(rows))]),
+            "c": np.array([c.get(j,0.0) for j in range(N)]), "constant": constant, "maximize": maximize,
+            "lower": lower, "upper": upper, "integer": np.array([integer[column] for column in columns],dtype=bool)}
+
+
+def BLP_read_aux(path):
+
+    #Helper Function: Reads the auxiliary file that marks the lower level of a bilevel instance stored as an MPS model
+    #Two formats are understood (files ending in .gz are decompressed on the fly):
+        #key-value lines: N and M (numbers of lower level columns and rows), LC and LR (0-based column and row indices in MPS order),
+        #LO (lower level objective coefficients, in the order of the LC lines) and OS (1 to minimize, -1 to maximize)
+        #sections opened by @ lines: @NUMVARS, @NUMCONSTRS, @VARSBEGIN ... @VARSEND (column name and lower level objective coefficient),
+        #@CONSTRSBEGIN ... @CONSTRSEND (row names), @OBJSENSE (MIN or MAX), @NAME and @MPS
+    #Returns: dictionary with the lower level "columns" and "rows" (indices or names), their objective coefficients "objective"
+    #(in the order of "columns") and the "sense" (1 to minimize, -1 to maximize)
+
+    opener = gzip.open if str(path).endswith(".gz") else open
+    aux = {"columns": [], "rows": [], "objective": [], "sense": 1}
+    section = None
+    with opener(path,"rt") as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens or tokens[0].startswith("#"):
+                continue
+            key = tokens[0].upper()
+            if key.startswith("@"):
+                section = key
+                if section == "@OBJSENSE" and len(tokens) > 1:
+                    aux["sense"] = -1 if tokens[1].upper() in ["MAX","MAXIMIZE"] else 1
+                elif section in ["@NAME","@MPS"] and len(tokens) > 1:
+                    aux[section[1:].lower()] = tokens[1]
+                continue
+
+            if section == "@VARSBEGIN":
+                aux["columns"].append(tokens[0])
+                aux["objective"].append(float(tokens[1]) if len(tokens) > 1 else 0.0)
+            elif section == "@CONSTRSBEGIN":
+                aux["rows"].append(tokens[0])
+            elif section == "@OBJSENSE":
+                aux["sense"] = -1 if key in ["MAX","MAXIMIZE"] else 1
+            elif section in ["@NAME","@MPS"]:
+                aux[section[1:].lower()] = tokens[0]
+            elif section in ["@NUMVARS","@NUMCONSTRS"]:
+                aux[section[1:].lower()] = int(tokens[0])
+            elif key == "LC":
+                aux["columns"].append(int(tokens[1]))
+            elif key == "LR":
+                aux["rows"].append(int(tokens[1]))
+            elif key == "LO":
+                aux["objective"].append(float(tokens[1]))
+            elif key == "OS":
+                aux["sense"] = int(float(tokens[1]))
+            elif key in ["N","M"]:
+                aux["numvars" if key == "N" else "numconstrs"] = int(tokens[1])
+
+    aux["objective"] = np.array(aux["objective"],dtype=float)
+    if len(aux["objective"]) == 0:
+        aux["objective"] = np.zeros(len(aux["columns"]))
+    if len(aux["objective"]) != len(aux["columns"]):
+        raise Exception("Error: Auxiliary file gives a different number of lower level columns and objective coefficients")
+    for key, items in [("numvars","columns"),("numconstrs","rows")]:
+        if key in aux and aux[key] != len(aux[items]):
+            raise Exception(f"Error: Auxiliary file announces {aux[key]} lower level {items} but lists {len(aux[items])}")
+    return aux
+
+
+def BLP_load_instance(mps_path,aux_path=None):
+
+    #Helper Function: Loads a bilevel instance stored as an MPS model plus an auxiliary file (see BLP_read_mps and BLP_read_aux)
+    #into a specification for solve_BLP (see BLP_spec), building the sparse blocks directly from the MPS matrix
+    #The auxiliary file defaults to the MPS path with .aux in place of .mps (keeping a .gz ending if there is one)
+    #Columns listed in the auxiliary file are y, the others x; rows listed there are lower level constraints, the others upper level
+    #Both objectives are turned into minimizations; the lower level objective has no x part, since it does not change the lower level
+    #G rows are negated into <= rows, ranged rows become two inequalities, and finite column bounds become constraints of the level
+    #that owns the column (so y >= 0 gives the lower level sign constraints -y <= 0, as in the hand-written problems)
+    #Returns: the specification, with the instance "name" and the boolean "integer" markers of x and y added
+
+    if aux_path is None:
+        base, gz = (str(mps_path)[:-3], ".gz") if str(mps_path).endswith(".gz") else (str(mps_path), "")
+        aux_path = os.path.splitext(base)[0] + ".aux"
+        aux_path = aux_path + gz if os.path.exists(aux_path + gz) else aux_path
+    model = BLP_read_mps(mps_path)
+    aux = BLP_read_aux(aux_path)
+
+    def lookup(items,names,kind):
+        #Auxiliary entries are indices or names; names are looked up in a dictionary built once, so loading stays linear in the size
+        index = {name: i for i, name in enumerate(names)}
+        unknown = [item for item in items if not isinstance(item,int) and item not in index]
+        if unknown:
+            raise Exception(f"Error: Auxiliary file lists unknown {kind} {unknown[0]}")
+        return np.array([item if isinstance(item,int) else index[item] for item in items],dtype=int)
+    lower_columns = lookup(aux["columns"],model["columns"],"column")
+    lower_rows = lookup(aux["rows"],model["rows"],"row")
+    is_y = np.zeros(len(model["columns"]),dtype=bool)
+    is_y[lower_columns] = True
+    is_lower_row = np.zeros(len(model["rows"]),dtype=bool)
+    is_lower_row[lower_rows] = True
+    x_cols, y_cols = np.flatnonzero(~is_y), np.flatnonzero(is_y)
+    if model["integer"].any():
+        warnings.warn(f"Integrality of {int(model['integer'].sum())} columns in {mps_path} is ignored; the continuous relaxation is solved")
+
+    #Every row as lower <= row <= upper, then split into <= rows and equality rows
+    matrix, rhs, ranges, types = model["matrix"], model["rhs"], model["ranges"], model["types"]
+    ranged = ~np.isnan(ranges)
+    R = np.nan_to_num(ranges)
+    L, G, E = types == "L", types == "G", types == "E"
+    row_lower, row_upper = np.full(len(rhs),-np.inf), np.full(len(rhs),np.inf)
+    row_upper[L] = rhs[L]
+    row_lower[L & ranged] = rhs[L & ranged] - np.abs(R[L & ranged])
+    row_lower[G] = rhs[G]
+    row_upper[G & ranged] = rhs[G & ranged] + np.abs(R[G & ranged])
+    row_lower[E] = rhs[E] + np.minimum(R[E],0)
+    row_upper[E] = rhs[E] + np.maximum(R[E],0)
+    equality = row_lower == row_upper
+
+    #Finite column bounds as singleton rows, owned by the level of their column
+    N = len(model["columns"])
+    bounded_below, bounded_above = np.flatnonzero(np.isfinite(model["lower"])), np.flatnonzero(np.isfinite(model["upper"]))
+    bound_rows = sp.csr_matrix((np.concatenate((-np.ones(len(bounded_below)),np.ones(len(bounded_above)))),
+                                (np.arange(len(bounded_below)+len(bounded_above)),np.concatenate((bounded_below,bounded_above)))),
+                               shape=(len(bounded_below)+len(bounded_above),N))
+    bound_rhs = np.concatenate((-model["lower"][bounded_below],model["upper"][bounded_above]))
+    bound_lower = np.concatenate((is_y[bounded_below],is_y[bounded_above]))
+
+    def level(lower_level):
+        rows = (is_lower_row == lower_level)
+        ineq = sp.vstack((matrix[rows & ~equality & np.isfinite(row_upper)],-matrix[rows & ~equality & np.isfinite(row_lower)],
+                          bound_rows[bound_lower == lower_level]),format="csr")
+        ineq_rhs = np.concatenate((row_upper[rows & ~equality & np.isfinite(row_upper)],-row_lower[rows & ~equality & np.isfinite(row_lower)],
+                                   bound_rhs[bound_lower == lower_level]))
+        stacked = sp.vstack((ineq,matrix[rows & equality]),format="csc")
+        return stacked[:,x_cols].tocsr(), stacked[:,y_cols].tocsr(), np.concatenate((ineq_rhs,rhs[rows & equality])), int((rows & equality).sum())
+
+    A, B, s, p2 = level(False)
+    C, D, t, q2 = level(True)
+
+    sign = -1 if model["maximize"] else 1
+    lower_c = np.zeros(N)
+    lower_c[lower_columns] = aux["sense"]*aux["objective"]
+    return {"name": model["name"] or os.path.basename(str(mps_path)).split(".")[0],
+            "upper_objective": [sign*model["c"][x_cols], sign*model["c"][y_cols], np.array([sign*model["constant"]])],
+            "lower_objective": [np.zeros(len(x_cols)), lower_c[y_cols], np.array([0.0])],
+            "A": A, "B": B, "s": s, "C": C, "D": D, "t": t, "p2": p2, "q2": q2,
+            "integer": [model["integer"][x_cols], model["integer"][y_cols]]}
+
+
+def BLP_instances(directory,pattern="*.mps*"):
+
+    #Helper Function: Lazily loads every bilevel instance of a directory (MPS files matching pattern, each with its auxiliary file)
+    #Only one instance is held in memory at a time, so a whole library can be fed to benchmark_BLP or a loop over solve_BLP
+    #MPS files without an auxiliary file next to them are skipped with a warning
+    #This is a generator: it yields (name, spec) pairs in sorted file name order (see BLP_load_instance)
+
+    for mps_path in sorted(glob.glob(os.path.join(directory,pattern))):
+        base = mps_path[:-3] if mps_path.endswith(".gz") else mps_path
+        if not base.endswith(".mps"):
+            continue
+        aux_path = next((path for path in [base[:-4] + ".aux", base[:-4] + ".aux.gz"] if os.path.exists(path)),None)
+        if aux_path is None:
+            warnings.warn(f"Skipping {mps_path}: no auxiliary file")
+            continue
+        spec = BLP_load_instance(mps_path,aux_path)
+        yield spec["name"], spec
+
+
+def benchmark_BLP(instances,methods=["enumerate","naive","branch_and_bound","milp","parallel"],time_limit=60,report_path=None,**options):
+
+    #Helper Function: Runs every method on every instance under a time limit and collects comparable statistics
+    #instances is a list (or any iterable, such as BLP_instances) of (name, spec) pairs, e.g. from generate_BLP or BLP_spec
+    #Further keyword options (M, tighten_M, presolve, ...) are passed on to solve_BLP
+    #For each run we record the time to the first bilevel feasible point, the time at which the best value was found,
+    #and the time to optimality (the total runtime, or None if the search was not proven optimal)
+    #"status" is "optimal" (or "infeasible" if no bilevel feasible point exists) for a finished search, "time_limit" for one stopped
+    #by the time limit, and for the MILP backend any other outcome reported by HiGHS ("infeasible", "unbounded" or "error"),
+    #which counts as a failure: it is not finished and gets no time to optimality
+    #Each run also keeps the per-phase timing summary of its linear programs under "profile" (see BLP_profile)
+    #Returns: list of one dictionary per run; if report_path is given, the list is also written there as JSON
+
+    report = []
+    for name, spec in instances:
+        n,m,p1,p2,q1,q2 = size_compatibility(spec)
+        for method in methods:
+            start_time = time.time()
+            LP_solutions, info = solve_BLP(spec=spec,method=method,time_limit=time_limit,return_info=True,**options)
+            total_time = time.time() - start_time
+
+            found = [sol for sol in LP_solutions if sol["value"] is not None and np.isfinite(sol["value"])]
+            best = min(found,key=lambda sol: (sol["value"],sol["time"])) if found else None
+            status = info.get("status",("optimal" if best else "infeasible") if info["finished"] else "time_limit")
+            report.append({"instance": name, "n": n, "m": m, "p": p1+p2, "q": q1+q2, "binaries": m+q1, "method": method,
+                           "finished": bool(info["finished"]), "status": status,
+                           "value": float(best["value"]) if best else None,
+                           "time_to_first_incumbent": found[0]["time"] if found else None,
+                           "time_to_best": best["time"] if best else None,
+                           "time_to_optimality": total_time if info["finished"] else None,
+                           "total_time": total_time, "linear_programs": len(LP_solutions), "nodes": int(info["nodes"]),
+                           "profile": info["profile"]})
+
+    if report_path is not None:
+        with open(report_path,"w") as f:
+            json.dump(report,f,indent=1)
+    return report
+
+
+def main(argv=None):
+
+    #Primary function: Command-line entry point that solves bilevel instances stored as MPS plus auxiliary files (see BLP_load_instance)
+    #Every path is an instance (.mps or .mps.gz, with its auxiliary file next to it) or a directory of instances (see BLP_instances)
+    #Instances are loaded one at a time; for every instance and method it prints the best value found, the number of linear programs,
+    #whether the search finished within the time limit and the wall time, and with --profile where that time went (see BLP_profile)
+    #Example: python bilevel_milp.py instances/ --method branch_and_bound milp --time-limit 60 --presolve --report runs.json
+
+    parser = argparse.ArgumentParser(description="Solve linear bilevel programs stored as MPS plus auxiliary files")
+    parser.add_argument("paths",nargs="+",help="instance files (.mps or .mps.gz, auxiliary file alongside) or directories of instances")
+    parser.add_argument("--method",nargs="+",default=["branch_and_bound"],help="search methods of solve_BLP (default: branch_and_bound)")
+    parser.add_argument("--time-limit",type=float,default=60,help="time limit in seconds per instance and method (default: 60)")
+    parser.add_argument("--M",type=float,default=100,help="big-M constant (default: 100)")
+    parser.add_argument("--tighten-M",action="store_true",help="derive a big-M per 0-1 constraint by bound tightening")
+    parser.add_argument("--presolve",action="store_true",help="remove fixed variables and redundant constraints first")
+    parser.add_argument("--gap",type=float,default=1e-6,help="relative optimality gap of the strong_duality method (default: 1e-6)")
+    parser.add_argument("--workers",type=int,default=None,help="worker processes of the parallel method (default: all CPUs)")
+    parser.add_argument("--no-warm-start",action="store_true",help="solve every linear program from scratch")
+    parser.add_argument("--no-nogoods",action="store_true",help="do not learn nogoods from infeasible assignments")
+    parser.add_argument("--profile",action="store_true",help="print the time spent in each phase of the linear programs")
+    parser.add_argument("--report",default=None,help="write every run as JSON to this path")
+    args = parser.parse_args(argv)
+
+    def instances():
+        for path in args.paths:
+            if os.path.isdir(path):
+                yield from BLP_instances(path)
+            else:
+                spec = BLP_load_instance(path)
+                yield spec["name"], spec
+
+    options = {"M": args.M, "tighten_M": args.tighten_M, "presolve": args.presolve, "gap": args.gap, "workers": args.workers,
+               "warm_start": not args.no_warm_start, "learn_nogoods": not args.no_nogoods}
+    report = []
+    print(f"{'instance':<30}{'method':>18}{'value':>16}{'LPs':>9}{'status':>10}{'time':>10}")
+    for instance in instances():
+        for run in benchmark_BLP([instance],methods=args.method,time_limit=args.time_limit,**options):
+            value = "-" if run["value"] is None else f"{run['value']:.6g}"
+            status = {"optimal": "optimal", "time_limit": "limit"}.get(run["status"],run["status"])
+            print(f"{run['instance']:<30}{run['method']:>18}{value:>16}{run['linear_programs']:>9}{status:>10}{run['total_time']:>9.2f}s")
+            if args.profile:
+                profile = run["profile"]
+                shares = [f"{phase} {totals['total']:.3f}s" for phase, totals in sorted(profile["phases"].items(),key=lambda item: -item[1]["total"])]
+                print(f"{'':<30}  " + ", ".join(shares + [f"other {profile['other']:.3f}s"]))
+            report.append(run)
+
+    if args.report is not None:
+        with open(args.report,"w") as f:
+            json.dump(report,f,indent=1)
+    return report
+
+
+if __name__ == "__main__":
+    main()